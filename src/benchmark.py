@@ -0,0 +1,357 @@
+# benchmark.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Benchmarks of the hot paths, used as `signwriter --benchmark`.
+#
+# Every stage runs on a synthetic document. Most of them do not need Gtk,
+# so the suite works offline and without a display. The window stages
+# ('grid-build', 'palette-tab-cycle') need an installed build and a
+# display, a virtual one is enough (xvfb-run, or a headless compositor),
+# and are reported as skipped without them. Each stage is timed a few times and run
+# once more under tracemalloc for its peak memory, and the results are
+# written as JSON so two runs can be compared.
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .document import Document
+from . import docfile, symbols
+
+class Skipped(Exception):
+    """A stage that can not run here."""
+
+gtk_application = None
+
+def get_gtk_application():
+    # The application the window stages build their windows in, made once
+
+    global gtk_application
+
+    if gtk_application is not None:
+        return gtk_application
+
+    import gi
+
+    gi.require_version('Gtk', '4.0')
+    gi.require_version('Adw', '1')
+
+    from gi.repository import Adw, Gio, Gtk
+
+    if not Gtk.init_check():
+        raise Skipped('no display')
+
+    # Installed next to the package by meson, the window template is in it
+    resource_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'signwriter.gresource')
+
+    if not os.path.exists(resource_path):
+        raise Skipped('the compiled resources are not installed')
+
+    Gio.Resource.load(resource_path)._register()
+    Adw.init()
+
+    # Imported only now, the window template is read from the resources
+    from .main import SignwriterApplication
+
+    gtk_application = SignwriterApplication(time.perf_counter())
+    gtk_application.register(None)
+
+    return gtk_application
+
+def run_main_loop():
+    # Let Gtk handle everything pending, as the layout and the first draw
+
+    from gi.repository import GLib
+
+    context = GLib.MainContext.default()
+
+    while context.pending():
+        context.iteration(False)
+
+def synthetic_document(row_quantity, column_quantity, seed=0):
+    """Build a document filled like a real transcript.
+
+    Most cells hold one to four symbols, some are empty and a few have a
+    space or a line break, always the same for a given seed.
+    """
+    randomizer = random.Random(seed)
+    entries = symbols.SEARCH_ENTRIES
+    document = Document(row_quantity, column_quantity)
+
+    for row in range(row_quantity):
+        for column in range(column_quantity):
+            if randomizer.random() < 0.1:
+                continue
+
+            for num in range(randomizer.randint(1, 4)):
+                document.append(row, column, entries[randomizer.randrange(len(entries))].text)
+
+            if randomizer.random() < 0.05:
+                document.append(row, column, randomizer.choice(('\n', '\u2004')))
+
+    return document
+
+def stage_document_build(parameters):
+    def run():
+        document = Document(parameters['rows'], parameters['columns'])
+
+        for row in range(parameters['rows']):
+            for column in range(parameters['columns']):
+                document.append(row, column, '\U0001D800')
+
+    return run
+
+def stage_document_resize(parameters):
+    document = synthetic_document(parameters['rows'], parameters['columns'])
+
+    def run():
+        document.resize(parameters['rows'] + 1, parameters['columns'])
+        document.resize(parameters['rows'], parameters['columns'])
+
+    return run
+
+def stage_symbol_catalogue_build(parameters):
+    def run():
+        symbols.build_categories()
+        symbols.SymbolIndex(symbols.SEARCH_ENTRIES)
+
+    return run
+
+def stage_symbol_search(parameters):
+    index = symbols.get_search_index()
+    queries = ('hand', 'hand fist', 'movement wall', 'rot', 'fill modifier', 'head', '1d8')
+
+    def run():
+        for query in queries:
+            index.search(query)
+
+    return run
+
+def stage_pdf_export(parameters, warm):
+    from . import render
+
+    document = synthetic_document(parameters['rows'], parameters['columns'])
+    path = os.path.join(parameters['directory'], 'benchmark.pdf')
+
+    if warm:
+        render.render_pdf(path, document)
+
+    def run():
+        if not warm:
+            render.layout_cache.entries.clear()
+
+        render.render_pdf(path, document)
+
+    return run
+
+def stage_page_export(parameters, workers):
+    from . import render
+
+    document = synthetic_document(parameters['rows'], parameters['columns'])
+    rows = list(document.iter_rows())
+    path = os.path.join(parameters['directory'], 'benchmark.png')
+
+    def run():
+        render.render_pages(path, 'png', rows, document.column_quantity, document.page_width,
+                            document.page_height, document.font_size, workers=workers)
+
+    return run
+
+def stage_grid_build(parameters):
+    application = get_gtk_application()
+
+    from .window import SignwriterWindow
+
+    data = synthetic_document(parameters['rows'], parameters['columns']).to_dict()
+
+    def run():
+        window = SignwriterWindow(application=application)
+        window.document.load(data)
+        window.present()
+        run_main_loop()
+        window.destroy()
+        run_main_loop()
+
+    return run
+
+def stage_palette_tab_cycle(parameters):
+    application = get_gtk_application()
+
+    from .window import SignwriterWindow
+
+    window = SignwriterWindow(application=application)
+    window.present()
+    window.push_screen(window.symbol_screen_button)
+    run_main_loop()
+
+    def run():
+        # The first cycle builds the pages, the next ones only switch
+        for name in symbols.CATEGORY_NAMES:
+            window.palette.show_page(None, name)
+            run_main_loop()
+
+    return run
+
+def stage_save_snapshot(parameters):
+    document = synthetic_document(parameters['rows'], parameters['columns'])
+    file = docfile.DocumentFile(os.path.join(parameters['directory'], 'benchmark.json'), document)
+
+    def run():
+        file.write_snapshot()
+
+    return run
+
+def stage_autosave_keystroke(parameters):
+    document = synthetic_document(parameters['rows'], parameters['columns'])
+    file = docfile.DocumentFile(os.path.join(parameters['directory'], 'benchmark.json'), document)
+    file.write_snapshot()
+
+    def run():
+        document.append(0, 0, '\U0001D800')
+        file.flush()
+
+    return run
+
+STAGES = (
+    ('document-build', stage_document_build),
+    ('document-resize', stage_document_resize),
+    ('symbol-catalogue-build', stage_symbol_catalogue_build),
+    ('symbol-search', stage_symbol_search),
+    ('pdf-export-cold', lambda parameters: stage_pdf_export(parameters, warm=False)),
+    ('pdf-export-warm', lambda parameters: stage_pdf_export(parameters, warm=True)),
+    ('png-export-serial', lambda parameters: stage_page_export(parameters, workers=1)),
+    ('png-export-parallel', lambda parameters: stage_page_export(parameters, workers=None)),
+    ('grid-build', stage_grid_build),
+    ('palette-tab-cycle', stage_palette_tab_cycle),
+    ('save-snapshot', stage_save_snapshot),
+    ('autosave-keystroke', stage_autosave_keystroke),
+)
+
+def measure(create_stage, parameters, repeat):
+    run = create_stage(parameters)
+    seconds = list()
+
+    for num in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'seconds': seconds,
+        'median': statistics.median(seconds),
+        'min': min(seconds),
+        'peak_bytes': peak,
+    }
+
+def run_benchmarks(parameters, repeat, selected=None):
+    results = dict()
+
+    with tempfile.TemporaryDirectory(prefix='signwriter-benchmark-') as directory:
+        for name, create_stage in STAGES:
+            if selected and name not in selected:
+                continue
+
+            try:
+                results[name] = measure(create_stage, dict(parameters, directory=directory), repeat)
+            except (ImportError, ValueError, Skipped) as error:
+                # The pdf stages need Pango and cairo, the window stages
+                # a display
+                results[name] = {'skipped': str(error)}
+
+            print(format_result(name, results[name]), file=sys.stderr)
+
+    return results
+
+def format_result(name, result):
+    if 'skipped' in result:
+        return f'{name:20} skipped: {result["skipped"]}'
+
+    return f'{name:20} {result["median"] * 1000:10.3f} ms {result["peak_bytes"] / 1024:10.1f} KiB'
+
+def compare(results, baseline, threshold):
+    # Returns the stages that got slower than the threshold allows
+
+    regressions = list()
+
+    for name, result in results.items():
+        old = baseline.get('results', dict()).get(name)
+
+        if old is None or 'median' not in old or 'median' not in result:
+            continue
+
+        ratio = result['median'] / old['median'] if old['median'] else 1
+        print(f'{name:20} {ratio:6.2f}x', file=sys.stderr)
+
+        if ratio > threshold:
+            regressions.append(name)
+
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='signwriter --benchmark',
+                                     description='Time the hot paths on synthetic documents.')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file instead of stdout')
+    parser.add_argument('--rows', type=int, default=999)
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stage', action='append', choices=[name for name, create_stage in STAGES],
+                        help='only run this stage, can be repeated')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown ratio that counts as a regression (default: 1.2)')
+    args = parser.parse_args(argv)
+
+    parameters = {'rows': args.rows, 'columns': args.columns}
+    report = {
+        'version': 1,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'repeat': args.repeat,
+        'results': run_benchmarks(parameters, args.repeat, args.stage),
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(report['results'], json.load(file), args.threshold)
+
+        if regressions:
+            print('regressions: ' + ', '.join(regressions), file=sys.stderr)
+            return 1
+
+    return 0
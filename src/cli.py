@@ -0,0 +1,141 @@
+# cli.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Command line renderer, used as `signwriter --render in.json -o out.pdf`
+# (or out.svg, out.png for one file per page),
+# and entry point of `signwriter --benchmark`.
+# Nothing here may import Gtk or Adw, so it starts fast and runs without
+# a display.
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .document import Document
+from . import docfile
+
+def main(argv):
+    """The command line entry point.
+
+    Args:
+        argv: the arguments without the program name
+    """
+    if '--benchmark' in argv:
+        from . import benchmark
+        return benchmark.main([arg for arg in argv if arg != '--benchmark'])
+
+    # Imported here, so --benchmark alone does not load Pango and cairo
+    from . import render
+
+    parser = argparse.ArgumentParser(prog='signwriter',
+                                     description='Render SignWriter documents as pdf, svg or png without opening a window.')
+    parser.add_argument('--render', nargs='+', required=True, metavar='INPUT',
+                        help='documents to render, directories are searched for *.json files')
+    parser.add_argument('-o', '--output', required=True,
+                        help='the output file, or a directory when there is more than one document')
+    parser.add_argument('-f', '--format', choices=render.FORMATS,
+                        help='pdf, or svg and png for one file per page (default: from the output extension, else pdf)')
+    parser.add_argument('--dpi', type=int, default=render.DEFAULT_DPI,
+                        help=f'resolution of the png pages (default: {render.DEFAULT_DPI})')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    args = parser.parse_args(argv)
+
+    inputs = find_documents(args.render)
+
+    if not inputs:
+        print('signwriter: no documents to render', file=sys.stderr)
+        return 1
+
+    output_format = args.format or output_format_of(args.output, render.FORMATS)
+    jobs = output_paths(inputs, args.output, output_format)
+
+    if len(jobs) == 1:
+        input_path, output_path = jobs[0]
+        return report(input_path, *render_file(input_path, output_path, output_format, args.dpi))
+
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        # Every process renders one document, its pages are not split
+        # again between threads
+        futures = {executor.submit(render_file, input_path, output_path, output_format, args.dpi, 1): input_path
+                   for input_path, output_path in jobs}
+
+        for future in as_completed(futures):
+            failed += report(futures[future], *future.result())
+
+    return 1 if failed else 0
+
+def find_documents(paths):
+    inputs = list()
+
+    for path in paths:
+        if os.path.isdir(path):
+            inputs.extend(os.path.join(path, name)
+                          for name in sorted(os.listdir(path))
+                          if name.endswith('.json'))
+        else:
+            inputs.append(path)
+
+    return inputs
+
+def output_format_of(path, formats):
+    extension = os.path.splitext(path)[1][1:].lower()
+    return extension if extension in formats else 'pdf'
+
+def output_paths(inputs, output, output_format):
+    if len(inputs) == 1 and not os.path.isdir(output):
+        return [(inputs[0], output)]
+
+    os.makedirs(output, exist_ok=True)
+
+    return [(path, os.path.join(output, os.path.splitext(os.path.basename(path))[0] + '.' + output_format))
+            for path in inputs]
+
+def render_file(input_path, output_path, output_format='pdf', dpi=None, workers=None):
+    # Runs in a worker process, errors are returned as text so they can be
+    # reported by the parent, together with the layout cache counters
+
+    from . import render
+
+    try:
+        data, journal_entries = docfile.read(input_path)
+        document = Document.from_dict(data)
+
+        if output_format == 'pdf':
+            cache_counters = render.render_pdf(output_path, document)
+        else:
+            cache_counters = render.render_pages(output_path, output_format, list(document.iter_rows()),
+                                                 document.column_quantity, document.page_width,
+                                                 document.page_height, document.font_size,
+                                                 dpi or render.DEFAULT_DPI, workers)
+    except Exception as error:
+        return f'{type(error).__name__}: {error}', None
+
+    return None, cache_counters
+
+def report(input_path, error, cache_counters):
+    if error is None:
+        print('{}: ok, layout cache {} hits, {} misses'.format(input_path, *cache_counters))
+        return 0
+
+    print(f'{input_path}: {error}', file=sys.stderr)
+    return 1
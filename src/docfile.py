@@ -0,0 +1,225 @@
+# docfile.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# The document file format.
+#
+# A document is one text file. Its first line is a JSON snapshot (the
+# structure of Document.to_dict plus a version), and the journal follows
+# it in the same file: one [row, column, text] line per changed cell.
+# Saving after an edit only appends the changed cells, the journal is
+# folded back into the snapshot once it gets long. Keeping both in one
+# file matters in the Flatpak sandbox, where the file portal only gives
+# access to the file the user picked, not to files next to it.
+
+import json
+import os
+
+VERSION = 1
+COMPACT_ENTRIES = 1000
+
+def read(path):
+    """Read a document file and replay its journal.
+
+    Args:
+        path: the document file
+
+    Returns:
+        the document data for Document.load, and the number of journal
+        entries that were replayed. The number is None when the journal
+        ends with a broken line, or the snapshot is not alone on the first
+        line: entries appended to it would be lost, so a new snapshot must
+        be written first.
+
+    Raises:
+        ValueError: when the file does not hold a document
+    """
+    with open(path, encoding='utf-8') as file:
+        first_line = file.readline()
+
+        try:
+            data = json.loads(first_line)
+            # Entries appended after a snapshot without its line break would
+            # be glued to it
+            appendable = first_line.endswith('\n')
+        except ValueError:
+            # Not written by flush(), as a snapshot indented by hand
+            file.seek(0)
+            data = json.load(file)
+            appendable = False
+
+        check(path, data)
+        journal_entries = replay_journal(file, data) if appendable else None
+
+    return data, journal_entries
+
+def check(path, data):
+    # Raises ValueError when data is not a document, and gives data one
+    # text for every cell
+
+    if not isinstance(data, dict):
+        raise ValueError(f'{path} is not a document')
+
+    if data.get('version', VERSION) > VERSION:
+        raise ValueError(f'{path} was written by a newer version')
+
+    rows = data['rows']
+    columns = data['columns']
+
+    if not (is_count(rows) and is_count(columns)):
+        raise ValueError(f'{path} has an invalid grid size')
+
+    for key in ('font_size', 'page_width', 'page_height'):
+        if key in data and not is_count(data[key]):
+            raise ValueError(f'{path} has an invalid {key}')
+
+    cells = data.setdefault('cells', list())
+
+    if not isinstance(cells, list) or not all(isinstance(row, list) for row in cells):
+        raise ValueError(f'{path} has invalid cells')
+
+    del cells[rows:]
+    cells.extend(list() for row in range(rows - len(cells)))
+
+    for row in cells:
+        del row[columns:]
+        row.extend('' for column in range(columns - len(row)))
+
+        if not all(isinstance(text, str) for text in row):
+            raise ValueError(f'{path} has a cell that is not text')
+
+def replay_journal(lines, data):
+    # Returns the number of entries replayed, or None when the journal can
+    # not be appended to
+
+    cells = data['cells']
+    entries = 0
+
+    for line in lines:
+        entry = read_journal_line(line)
+
+        # A write cut short by a crash leaves a broken last line
+        if not is_journal_entry(entry):
+            return None
+
+        row, column, text = entry
+
+        if row < data['rows'] and column < data['columns']:
+            cells[row][column] = text
+            entries += 1
+
+    return entries
+
+def is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+def is_journal_entry(entry):
+    return (isinstance(entry, list) and len(entry) == 3
+            and isinstance(entry[0], int) and isinstance(entry[1], int)
+            and entry[0] >= 0 and entry[1] >= 0 and isinstance(entry[2], str))
+
+def read_journal_line(line):
+    if not line.endswith('\n'):
+        return None
+
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+class DocumentFile():
+    """Keeps a document saved in a file.
+
+    Changed cells are collected while the user edits, flush() then either
+    appends them to the journal or writes a new snapshot.
+    """
+
+    def __init__(self, path, document, journal_entries=None):
+        """
+        Args:
+            path: the document file
+            document: the Document saved in it
+            journal_entries: the entries already in the journal, None when
+              the file does not hold this document yet or its journal can
+              not be appended to
+        """
+        self.path = path
+        self.document = document
+        self.dirty = set()
+        self.journal_entries = journal_entries or 0
+        self.needs_snapshot = journal_entries is None
+        self.settings = self.get_settings()
+
+        document.connect('cell-changed', self.on_cell_changed)
+        document.connect('resized', self.on_resized)
+        document.connect('reset', self.on_resized)
+
+    def close(self):
+        self.document.disconnect('cell-changed', self.on_cell_changed)
+        self.document.disconnect('resized', self.on_resized)
+        self.document.disconnect('reset', self.on_resized)
+
+    def get_settings(self):
+        return (self.document.font_size, self.document.page_width, self.document.page_height)
+
+    def on_cell_changed(self, row, column):
+        self.dirty.add((row, column))
+
+    def on_resized(self, *args):
+        self.needs_snapshot = True
+
+    def flush(self):
+        if (self.needs_snapshot
+                or self.settings != self.get_settings()
+                or self.journal_entries + len(self.dirty) > max(COMPACT_ENTRIES, self.document.row_quantity * self.document.column_quantity)):
+            self.write_snapshot()
+        elif self.dirty:
+            self.write_journal()
+
+    def write_journal(self):
+        # One write, so a crash leaves at most one broken line at the end
+        lines = ''.join(json.dumps([row, column, self.document.get_text(row, column)], ensure_ascii=False) + '\n'
+                        for row, column in self.dirty)
+
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(lines)
+
+        self.journal_entries += len(self.dirty)
+        self.dirty.clear()
+
+    def write_snapshot(self):
+        data = self.document.to_dict()
+        data['version'] = VERSION
+
+        # Written next to the old file and renamed over it, so a crash
+        # never leaves a half written snapshot behind. The file portal
+        # allows such a temporary file as long as it replaces the document.
+        temporary_path = self.path + '.tmp'
+
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            # JSON escapes line breaks in strings, the snapshot stays on
+            # the first line
+            json.dump(data, file, ensure_ascii=False)
+            file.write('\n')
+
+        os.replace(temporary_path, self.path)
+
+        self.journal_entries = 0
+        self.needs_snapshot = False
+        self.settings = self.get_settings()
+        self.dirty.clear()
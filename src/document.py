@@ -0,0 +1,304 @@
+# document.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from array import array
+
+SIGNWRITING_FIRST = 0x1D800
+SIGNWRITING_LAST = 0x1DAAF
+
+# Symbols of the SignWriting block are stored as their offset in the
+# block. Anything else a cell may hold gets a code from OTHER_FIRST on,
+# the line break and the space first.
+OTHER_FIRST = 0x1000
+other_symbols = ['\n', '\u2004']
+other_codes = {symbol: OTHER_FIRST + number for number, symbol in enumerate(other_symbols)}
+
+DECODED = [chr(SIGNWRITING_FIRST + code) for code in range(SIGNWRITING_LAST - SIGNWRITING_FIRST + 1)]
+
+def encode_symbol(symbol):
+    if len(symbol) == 1 and SIGNWRITING_FIRST <= ord(symbol) <= SIGNWRITING_LAST:
+        return ord(symbol) - SIGNWRITING_FIRST
+
+    code = other_codes.get(symbol)
+
+    if code is None:
+        code = OTHER_FIRST + len(other_symbols)
+
+        if code > 0xFFFF:
+            raise ValueError('too many different symbols outside the SignWriting block')
+
+        other_symbols.append(symbol)
+        other_codes[symbol] = code
+
+    return code
+
+def decode_symbol(code):
+    return DECODED[code] if code < OTHER_FIRST else other_symbols[code - OTHER_FIRST]
+
+def encode_cell(symbols):
+    return array('H', [encode_symbol(symbol) for symbol in symbols])
+
+def decode_cell(cell):
+    return [decode_symbol(code) for code in cell]
+
+class Document():
+    """The grid of cells written by the user.
+
+    Cells are addressed by integer (row, column). Every row keeps the
+    symbols of all its cells in one array of 16 bit codes (see
+    encode_symbol), two bytes a symbol, with an array of offsets where
+    each cell starts. Rows without any symbol hold None instead, so empty
+    cells cost nothing. Symbols are only turned back into text for the
+    views and the exports.
+    The document does not know about Gtk, views subscribe with connect()
+    and are told which cell changed. The pdf settings are kept here too,
+    so a document can be rendered without a window.
+    """
+
+    __slots__ = ('row_quantity', 'column_quantity', 'row_codes', 'row_offsets', 'handlers',
+                 'font_size', 'page_width', 'page_height')
+
+    def __init__(self, row_quantity, column_quantity):
+        self.handlers = {'cell-changed': list(), 'edited': list(), 'resized': list(), 'reset': list(),
+                         'settings-changed': list()}
+        # Per row, the codes of its cells one after the other and the
+        # column_quantity + 1 offsets of the cells in them, or None
+        self.row_codes = list()
+        self.row_offsets = list()
+        self.font_size = 20
+        self.page_width = 595
+        self.page_height = 842
+        self.reset(row_quantity, column_quantity)
+
+    @classmethod
+    def from_dict(cls, data):
+        document = cls(data['rows'], data['columns'])
+        document.load(data)
+        return document
+
+    def load(self, data):
+        # Replace the whole document with the structure written by to_dict
+
+        self.font_size = data.get('font_size', self.font_size)
+        self.page_width = data.get('page_width', self.page_width)
+        self.page_height = data.get('page_height', self.page_height)
+        self.row_quantity = data['rows']
+        self.column_quantity = data['columns']
+        self.row_codes = [None] * self.row_quantity
+        self.row_offsets = [None] * self.row_quantity
+
+        for row, texts in enumerate(data.get('cells', list())[:self.row_quantity]):
+            texts = texts[:self.column_quantity]
+
+            if not any(texts):
+                continue
+
+            codes = array('H')
+            offsets = array('I', [0])
+
+            for text in texts:
+                codes.extend(encode_symbol(symbol) for symbol in text)
+                offsets.append(len(codes))
+
+            offsets.extend(len(codes) for column in range(self.column_quantity - len(texts)))
+            self.row_codes[row] = codes
+            self.row_offsets[row] = offsets
+
+        self.emit('reset')
+
+    def to_dict(self):
+        return {
+            'rows': self.row_quantity,
+            'columns': self.column_quantity,
+            'font_size': self.font_size,
+            'page_width': self.page_width,
+            'page_height': self.page_height,
+            'cells': list(self.iter_rows()),
+        }
+
+    def connect(self, signal, callback):
+        """Call callback when signal is emitted.
+
+        Args:
+            signal: 'cell-changed', called with (row, column), 'edited',
+              called with a description of the edit (see below),
+              'resized', called with the old (row_quantity,
+              column_quantity), 'reset', called without arguments after
+              the whole grid changed, or 'settings-changed', called
+              without arguments after the font or page size changed
+            callback: the function to be called
+
+        The 'edited' descriptions are ('append', row, column, symbol),
+        ('pop', row, column, symbol), ('set', row, column, old_symbols,
+        new_symbols) and ('resize', old_row_quantity, old_column_quantity,
+        row_quantity, column_quantity, removed), where removed lists the
+        (row, column, symbols) of the non empty cells that were dropped.
+        """
+        self.handlers[signal].append(callback)
+
+    def disconnect(self, signal, callback):
+        self.handlers[signal].remove(callback)
+
+    def emit(self, signal, *args):
+        for callback in self.handlers[signal]:
+            callback(*args)
+
+    def reset(self, row_quantity, column_quantity):
+        # Replace the grid with an empty one of the given size
+
+        self.row_quantity = row_quantity
+        self.column_quantity = column_quantity
+        self.row_codes = [None] * row_quantity
+        self.row_offsets = [None] * row_quantity
+        self.emit('reset')
+
+    def resize(self, row_quantity, column_quantity):
+        # Keep the existing cells and only add or remove the difference
+
+        old_row_quantity = self.row_quantity
+        old_column_quantity = self.column_quantity
+        removed = list()
+
+        if row_quantity < old_row_quantity:
+            for row in range(row_quantity, old_row_quantity):
+                removed.extend((row, column, self.get_symbols(row, column))
+                               for column in range(old_column_quantity) if not self.is_empty(row, column))
+
+            del self.row_codes[row_quantity:]
+            del self.row_offsets[row_quantity:]
+
+        if column_quantity != old_column_quantity:
+            for row, (codes, offsets) in enumerate(zip(self.row_codes, self.row_offsets)):
+                if codes is None:
+                    continue
+
+                if column_quantity < old_column_quantity:
+                    removed.extend((row, column, self.get_symbols(row, column))
+                                   for column in range(column_quantity, old_column_quantity)
+                                   if not self.is_empty(row, column))
+                    del codes[offsets[column_quantity]:]
+                    del offsets[column_quantity + 1:]
+
+                    if not codes:
+                        self.row_codes[row] = None
+                        self.row_offsets[row] = None
+                else:
+                    offsets.extend(len(codes) for column in range(column_quantity - old_column_quantity))
+
+        if row_quantity > old_row_quantity:
+            self.row_codes.extend(None for row in range(row_quantity - old_row_quantity))
+            self.row_offsets.extend(None for row in range(row_quantity - old_row_quantity))
+
+        self.row_quantity = row_quantity
+        self.column_quantity = column_quantity
+        self.emit('resized', old_row_quantity, old_column_quantity)
+        self.emit('edited', 'resize', old_row_quantity, old_column_quantity, row_quantity, column_quantity, removed)
+
+    def set_font_size(self, font_size):
+        self.font_size = font_size
+        self.emit('settings-changed')
+
+    def set_page_size(self, page_width, page_height):
+        self.page_width = page_width
+        self.page_height = page_height
+        self.emit('settings-changed')
+
+    def get_codes(self, row, column):
+        # A new array with the codes of the cell
+
+        offsets = self.row_offsets[row]
+
+        if offsets is None:
+            return array('H')
+
+        return self.row_codes[row][offsets[column]:offsets[column + 1]]
+
+    def replace_codes(self, row, column, start, end, codes):
+        # Replace the codes from start to end (positions in the cell) of
+        # a cell, the offsets of the cells after it follow
+
+        if self.row_codes[row] is None:
+            if not codes:
+                return
+
+            self.row_codes[row] = array('H')
+            self.row_offsets[row] = array('I', bytes(4 * (self.column_quantity + 1)))
+
+        row_codes = self.row_codes[row]
+        offsets = self.row_offsets[row]
+        cell_start = offsets[column]
+        row_codes[cell_start + start:cell_start + end] = codes
+        change = len(codes) - (end - start)
+
+        for next_column in range(column + 1, self.column_quantity + 1):
+            offsets[next_column] += change
+
+        if not row_codes:
+            self.row_codes[row] = None
+            self.row_offsets[row] = None
+
+    def get_text(self, row, column):
+        return ''.join(decode_cell(self.get_codes(row, column)))
+
+    def get_symbols(self, row, column):
+        # A new list, changing it does not change the cell
+        return decode_cell(self.get_codes(row, column))
+
+    def get_length(self, row, column):
+        offsets = self.row_offsets[row]
+        return 0 if offsets is None else offsets[column + 1] - offsets[column]
+
+    def is_empty(self, row, column):
+        return self.get_length(row, column) == 0
+
+    def set_symbols(self, row, column, symbols):
+        old_symbols = self.get_symbols(row, column)
+        self.replace_codes(row, column, 0, len(old_symbols), encode_cell(symbols))
+        self.emit('cell-changed', row, column)
+        self.emit('edited', 'set', row, column, old_symbols, list(symbols))
+
+    def append(self, row, column, symbol):
+        length = self.get_length(row, column)
+        self.replace_codes(row, column, length, length, array('H', [encode_symbol(symbol)]))
+        self.emit('cell-changed', row, column)
+        self.emit('edited', 'append', row, column, symbol)
+
+    def pop(self, row, column):
+        length = self.get_length(row, column)
+
+        if not length:
+            return None
+
+        offsets = self.row_offsets[row]
+        symbol = decode_symbol(self.row_codes[row][offsets[column] + length - 1])
+        self.replace_codes(row, column, length - 1, length, array('H'))
+        self.emit('cell-changed', row, column)
+        self.emit('edited', 'pop', row, column, symbol)
+        return symbol
+
+    def iter_rows(self):
+        # Yields every row as a list with the text of each cell
+
+        for codes, offsets in zip(self.row_codes, self.row_offsets):
+            if codes is None:
+                yield [''] * self.column_quantity
+            else:
+                text = decode_cell(codes)
+                yield [''.join(text[offsets[column]:offsets[column + 1]])
+                       for column in range(self.column_quantity)]
@@ -0,0 +1,247 @@
+# fsw.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Reading of Formal SignWriting text, in its ASCII form (FSW, as in
+# 'AS10011S2e704M525x535S2e704510x500S10011501x466') and in its Unicode
+# form (SWU, the same structure written with the plane 4 symbols and the
+# 𝠀-𝠄 markers of the SignWriting block).
+#
+# Every sign becomes the symbols of one cell, written as the palette
+# writes them: the base symbol of the SignWriting block followed by its
+# fill and rotation modifiers. The positions of the symbols inside the
+# sign are not kept, the grid has no use for them. The text is read in
+# chunks, so files of any size only keep one chunk in memory.
+
+import re
+
+# ISWA symbol bases, S100 to S38b
+FIRST_BASE = 0x100
+LAST_BASE = 0x38b
+
+FILL_MODIFIER = 0x1DA9A
+ROTATION_MODIFIER = 0x1DAA0
+
+FSW_PREFIX = re.compile(r'A')
+FSW_BOX = re.compile(r'[BLMR]')
+FSW_SYMBOL = re.compile(r'S([123][0-9a-f]{2})([0-5])([0-9a-f])')
+FSW_COORDINATE = re.compile(r'[0-9]{3}x[0-9]{3}')
+
+SWU_PREFIX = re.compile('\U0001D800')
+SWU_BOX = re.compile('[\U0001D801-\U0001D804]')
+SWU_SYMBOL = re.compile('[\U00040001-\U0004F480]')
+SWU_COORDINATE = re.compile('[\U0001D80C-\U0001D9FF]{2}')
+
+WORD = re.compile(r'\S+')
+
+class ParseError(ValueError):
+    """Malformed text, line and column (both from 1) point at the character
+    where the reading stopped."""
+
+    def __init__(self, message, line, column):
+        super().__init__(f'{line}:{column}: {message}')
+        self.line = line
+        self.column = column
+
+def symbol_text(base, fill, rotation):
+    # The symbols a cell gets for one ISWA symbol
+
+    if not FIRST_BASE <= base <= LAST_BASE:
+        return None
+
+    text = [chr(0x1D800 + base - FIRST_BASE)]
+
+    if fill:
+        text.append(chr(FILL_MODIFIER + fill))
+
+    if rotation:
+        text.append(chr(ROTATION_MODIFIER + rotation))
+
+    return text
+
+class SignReader():
+    """Parser of one sign, or one punctuation, in FSW or SWU."""
+
+    def __init__(self, prefix, box, symbol, coordinate, decode):
+        self.prefix = prefix
+        self.box = box
+        self.symbol = symbol
+        self.coordinate = coordinate
+        self.decode = decode
+
+    def read(self, word):
+        """Read the symbols of word.
+
+        Returns:
+            the list of cell symbols
+
+        Raises:
+            ValueError: with the message and the position in word of the
+              first character that does not fit
+        """
+        position = 0
+        prefix = list()
+
+        if self.prefix.match(word):
+            position = 1
+
+            while position < len(word) and not self.box.match(word, position):
+                position = self.read_symbol(word, position, prefix)
+
+            if not prefix:
+                raise SignError('expected a symbol after the sign prefix', position)
+
+        if self.box.match(word, position):
+            position = self.read_coordinate(word, position + 1)
+            spatial = list()
+
+            while position < len(word):
+                position = self.read_symbol(word, position, spatial)
+                position = self.read_coordinate(word, position)
+
+            # The prefix gives the reading order, the spatial symbols are in
+            # no particular order
+            return prefix or spatial
+
+        if prefix:
+            raise SignError('expected a sign box', position)
+
+        # A punctuation, a lone symbol with its position
+        position = self.read_symbol(word, position, prefix)
+        position = self.read_coordinate(word, position)
+
+        if position < len(word):
+            raise SignError('unexpected character after the punctuation', position)
+
+        return prefix
+
+    def read_symbol(self, word, position, symbols):
+        match = self.symbol.match(word, position)
+        text = self.decode(match) if match else None
+
+        if text is None:
+            raise SignError('expected a symbol', position)
+
+        symbols.extend(text)
+        return match.end()
+
+    def read_coordinate(self, word, position):
+        match = self.coordinate.match(word, position)
+
+        if not match:
+            raise SignError('expected a coordinate', position)
+
+        return match.end()
+
+class SignError(ValueError):
+    def __init__(self, message, position):
+        super().__init__(message)
+        self.position = position
+
+def decode_fsw(match):
+    return symbol_text(int(match.group(1), 16), int(match.group(2)), int(match.group(3), 16))
+
+def decode_swu(match):
+    number = ord(match.group()) - 0x40001
+    return symbol_text(number // 96 + FIRST_BASE, number % 96 // 16, number % 16)
+
+FSW_READER = SignReader(FSW_PREFIX, FSW_BOX, FSW_SYMBOL, FSW_COORDINATE, decode_fsw)
+SWU_READER = SignReader(SWU_PREFIX, SWU_BOX, SWU_SYMBOL, SWU_COORDINATE, decode_swu)
+
+def read_symbol_keys(text):
+    """Read FSW symbol keys, as in 'S10011 S2e704', into cell symbols.
+
+    Raises:
+        ValueError: when text holds something else than symbol keys
+    """
+    cell = list()
+    position = 0
+
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+
+        if position == len(text):
+            return cell
+
+        match = FSW_SYMBOL.match(text, position)
+        symbol = decode_fsw(match) if match else None
+
+        if symbol is None:
+            raise ValueError(f'{position + 1}: expected a symbol key')
+
+        cell.extend(symbol)
+        position = match.end()
+
+def read_words(file, chunk_size=65536):
+    """Yield (word, line, column) for every whitespace separated word of a
+    text file, reading it chunk_size characters at a time."""
+
+    line = 1
+    line_start = 0
+    # Characters of the file before buffer
+    offset = 0
+    buffer = ''
+
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        end = 0
+
+        for match in WORD.finditer(buffer):
+            # A word touching the end of the chunk may go on in the next one
+            if chunk and match.end() == len(buffer):
+                break
+
+            newlines = buffer.count('\n', end, match.start())
+
+            if newlines:
+                line += newlines
+                line_start = offset + buffer.rindex('\n', end, match.start()) + 1
+
+            yield match.group(), line, offset + match.start() - line_start + 1
+            end = match.end()
+
+        if not chunk:
+            return
+
+        newlines = buffer.count('\n', end)
+
+        if newlines:
+            line += newlines
+            line_start = offset + buffer.rindex('\n', end) + 1
+
+        # Keep only what was not read yet
+        rest = WORD.search(buffer, end)
+        start = rest.start() if rest else len(buffer)
+        offset += start
+        buffer = buffer[start:]
+
+def read_signs(file, chunk_size=65536):
+    """Yield the cell symbols of every sign of a FSW or SWU text file.
+
+    Raises:
+        ParseError: at the first malformed sign
+    """
+    for word, line, column in read_words(file, chunk_size):
+        reader = FSW_READER if word[0].isascii() else SWU_READER
+
+        try:
+            yield reader.read(word)
+        except SignError as error:
+            raise ParseError(str(error), line, column + error.position) from None
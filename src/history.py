@@ -0,0 +1,215 @@
+# history.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from collections import deque
+
+# Rough memory cost of the history entries, in bytes
+ENTRY_SIZE = 120
+SYMBOL_SIZE = 8
+CELL_SIZE = 64
+
+class Edit():
+    """One undo step.
+
+    kind is 'insert' or 'delete' (symbols typed or removed at the end of
+    one cell), 'set' (a cell replaced), 'resize' or 'group'. Only the
+    changed symbols are kept, never a copy of the document. For 'resize',
+    row and column hold the (old, new) quantities and symbols the removed
+    cells. A 'group' is undone in one step, symbols holds its edits.
+    """
+
+    __slots__ = ('kind', 'row', 'column', 'symbols', 'new_symbols', 'size')
+
+    def __init__(self, kind, row, column, symbols, new_symbols=None, size=None):
+        self.kind = kind
+        self.row = row
+        self.column = column
+        self.symbols = symbols
+        self.new_symbols = new_symbols
+        self.size = size
+
+    def get_size(self):
+        if self.kind == 'group':
+            return ENTRY_SIZE + sum(edit.get_size() for edit in self.symbols)
+
+        if self.kind == 'resize':
+            return ENTRY_SIZE + sum(CELL_SIZE + SYMBOL_SIZE * len(cell) for row, column, cell in self.symbols)
+
+        return ENTRY_SIZE + SYMBOL_SIZE * (len(self.symbols) + len(self.new_symbols or ()))
+
+class History():
+    """Undo and redo stacks fed by the 'edited' signal of a Document.
+
+    Consecutive symbols typed in (or removed from) the same cell are merged
+    into one step. Once the steps take more than max_size bytes the oldest
+    ones are dropped, so long sessions keep a flat memory use.
+    """
+
+    def __init__(self, document, max_size=4 * 1024 * 1024):
+        self.document = document
+        self.max_size = max_size
+        self.undo_stack = deque()
+        self.redo_stack = list()
+        self.size = 0
+        self.applying = False
+        self.merge = True
+        self.group = None
+
+        document.connect('edited', self.on_edited)
+        document.connect('reset', self.clear)
+
+    def clear(self, *args):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.size = 0
+
+    def break_merge(self):
+        # The next edit starts a new step even if it is in the same cell
+        self.merge = False
+
+    def begin_group(self):
+        # Every edit until end_group() is undone and redone as one step
+        self.group = list()
+
+    def end_group(self):
+        edits = self.group
+        self.group = None
+
+        if edits:
+            self.push(Edit('group', None, None, edits))
+
+        self.merge = False
+
+    def cancel_group(self):
+        # Undo the edits made since begin_group() and forget them
+        edits = self.group
+        self.group = None
+
+        if edits:
+            self.apply(Edit('group', None, None, edits), undo=True)
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def on_edited(self, kind, *args):
+        if self.applying:
+            return
+
+        self.redo_stack.clear()
+
+        if kind == 'append' or kind == 'pop':
+            row, column, symbol = args
+            kind = 'insert' if kind == 'append' else 'delete'
+            last = self.undo_stack[-1] if self.undo_stack else None
+
+            # A step stops growing once it alone would fill the history
+            if (self.merge and self.group is None and last is not None and last.kind == kind
+                    and last.row == row and last.column == column
+                    and last.size + SYMBOL_SIZE <= self.max_size):
+                last.symbols.append(symbol)
+                last.size += SYMBOL_SIZE
+                self.size += SYMBOL_SIZE
+                self.trim()
+                return
+
+            edit = Edit(kind, row, column, [symbol])
+        elif kind == 'set':
+            row, column, old_symbols, new_symbols = args
+            edit = Edit('set', row, column, old_symbols, list(new_symbols))
+        else:
+            old_row_quantity, old_column_quantity, row_quantity, column_quantity, removed = args
+            edit = Edit('resize', (old_row_quantity, row_quantity), (old_column_quantity, column_quantity), removed)
+
+        self.merge = True
+
+        if self.group is not None:
+            self.group.append(edit)
+            return
+
+        self.push(edit)
+
+    def push(self, edit):
+        edit.size = edit.get_size()
+        self.undo_stack.append(edit)
+        self.size += edit.size
+        self.trim()
+
+    def trim(self):
+        # The last step is always kept, even if it alone is too big
+        while self.size > self.max_size and len(self.undo_stack) > 1:
+            self.size -= self.undo_stack.popleft().size
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+
+        edit = self.undo_stack.pop()
+        self.size -= edit.size
+        self.apply(edit, undo=True)
+        self.redo_stack.append(edit)
+        self.merge = False
+        return edit
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+
+        edit = self.redo_stack.pop()
+        self.apply(edit, undo=False)
+        self.undo_stack.append(edit)
+        self.size += edit.size
+        self.merge = False
+        return edit
+
+    def apply(self, edit, undo):
+        document = self.document
+        self.applying = True
+
+        try:
+            if edit.kind == 'group':
+                for grouped_edit in (reversed(edit.symbols) if undo else edit.symbols):
+                    self.apply(grouped_edit, undo)
+            elif edit.kind == 'resize':
+                old_row_quantity, row_quantity = edit.row
+                old_column_quantity, column_quantity = edit.column
+
+                if undo:
+                    document.resize(old_row_quantity, old_column_quantity)
+
+                    for row, column, symbols in edit.symbols:
+                        document.set_symbols(row, column, symbols)
+                else:
+                    document.resize(row_quantity, column_quantity)
+            elif edit.kind == 'set':
+                document.set_symbols(edit.row, edit.column, edit.symbols if undo else edit.new_symbols)
+            elif (edit.kind == 'insert') == undo:
+                for symbol in edit.symbols:
+                    document.pop(edit.row, edit.column)
+            elif edit.kind == 'insert':
+                for symbol in edit.symbols:
+                    document.append(edit.row, edit.column, symbol)
+            else:
+                # Deleted symbols were recorded last one first
+                for symbol in reversed(edit.symbols):
+                    document.append(edit.row, edit.column, symbol)
+        finally:
+            self.applying = False
@@ -17,24 +17,56 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import os
 import sys
+import time
 import gi
 
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 
-from gi.repository import Gtk, Gio, Adw
-from .window import SignwriterWindow
+from gi.repository import Gtk, Gio, GLib, Adw
+from .window import SignwriterWindow, instrument_hot_paths
+from . import profiling
 from locale import gettext
 
 class SignwriterApplication(Adw.Application):
     """The main application singleton class."""
 
-    def __init__(self):
+    def __init__(self, start_time):
         super().__init__(application_id='io.github.Samuel_Schlemper_Schlemuel.SignWriter',
                          flags=Gio.ApplicationFlags.DEFAULT_FLAGS)
+        self.start_time = start_time
+        self.startup_report = False
+        self.startup_limit = None
+        self.startup_too_slow = False
+
         self.create_action('quit', lambda *_: self.quit(), ['<primary>q'])
         self.create_action('about', self.on_about_action)
+        self.add_main_option('profile', 0, GLib.OptionFlags.NONE, GLib.OptionArg.FILENAME,
+                             'Record a performance trace of the session in FILE', 'FILE')
+        self.add_main_option('startup-limit', 0, GLib.OptionFlags.NONE, GLib.OptionArg.INT,
+                             'Print the startup times, quit after the first frame and fail '
+                             'if it took more than MS milliseconds', 'MS')
+
+    def do_handle_local_options(self, options):
+        # --profile wins over the environment variable
+        path = os.environ.get(profiling.ENVIRONMENT_VARIABLE)
+
+        if options.contains('profile'):
+            path = os.fsdecode(options.lookup_value('profile', GLib.VariantType('ay')).get_bytestring())
+
+        if path:
+            profiling.enable(path)
+            instrument_hot_paths()
+            self.connect('shutdown', lambda *args: profiling.write())
+            self.startup_report = True
+
+        if options.contains('startup-limit'):
+            self.startup_limit = options.lookup_value('startup-limit', GLib.VariantType('i')).get_int32()
+            self.startup_report = True
+
+        return -1
 
     def do_activate(self):
         """Called when the application is activated.
@@ -44,9 +76,35 @@ class SignwriterApplication(Adw.Application):
         """
         win = self.props.active_window
         if not win:
+            activate_time = time.perf_counter()
             win = SignwriterWindow(application=self)
+
+            if self.startup_report:
+                window_time = time.perf_counter()
+                win.add_tick_callback(self.on_first_frame, activate_time, window_time)
         win.present()
 
+    def on_first_frame(self, win, frame_clock, activate_time, window_time):
+        # Times are counted from the start of the launcher, the first tick
+        # comes when the window is about to be drawn for the first time
+        first_frame = (time.perf_counter() - self.start_time) * 1000
+
+        print('Startup: {:.0f} ms to first frame (imports {:.0f} ms, window {:.0f} ms, '
+              'layout and drawing {:.0f} ms)'.format(first_frame,
+                                                   (activate_time - self.start_time) * 1000,
+                                                   (window_time - activate_time) * 1000,
+                                                   first_frame - (window_time - self.start_time) * 1000),
+              file=sys.stderr)
+
+        if self.startup_limit is not None:
+            if first_frame > self.startup_limit:
+                print(f'Startup took more than the {self.startup_limit} ms limit', file=sys.stderr)
+                self.startup_too_slow = True
+
+            self.quit()
+
+        return GLib.SOURCE_REMOVE
+
     def on_about_action(self, widget, _):
         """Callback for the app.about action."""
         about = Adw.AboutDialog(
@@ -60,6 +118,9 @@ class SignwriterApplication(Adw.Application):
 			license_type=Gtk.License.GPL_3_0,
 			)
 
+        if profiling.profiler is not None:
+            about.set_debug_info(profiling.profiler.summary())
+
         about.present()
 
     def create_action(self, name, callback, shortcuts=None):
@@ -70,17 +131,27 @@ class SignwriterApplication(Adw.Application):
             callback: the function to be called when the action is
               activated
             shortcuts: an optional list of accelerators
+
+        Returns:
+            the Gio.SimpleAction, to change its enabled state
         """
         action = Gio.SimpleAction.new(name, None)
         action.connect("activate", callback)
         self.add_action(action)
         if shortcuts:
             self.set_accels_for_action(f"app.{name}", shortcuts)
+        return action
+
+
+def main(version, start_time=None):
+    """The application's entry point.
 
+    start_time is the time.perf_counter() value when the launcher started,
+    used by the startup report.
+    """
+    app = SignwriterApplication(start_time or time.perf_counter())
+    status = app.run(sys.argv)
 
-def main(version):
-    """The application's entry point."""
-    app = SignwriterApplication()
-    return app.run(sys.argv)
+    return 1 if app.startup_too_slow else status
 
 
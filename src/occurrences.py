@@ -0,0 +1,222 @@
+# occurrences.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Find and replace of symbols in a document.
+#
+# A symbol and the fill and rotation modifiers written after it form a
+# group, and queries match whole groups. The cells holding each symbol
+# are kept in an index that follows the document signals, so a search
+# only looks at the cells that have every symbol of the query.
+
+import itertools
+
+from . import symbols
+
+def split_groups(cell):
+    # [hand, fill, rotation, movement] -> [(hand, fill, rotation), (movement,)]
+
+    groups = list()
+
+    for symbol in cell:
+        if groups and symbols.is_modifier(symbol) and not symbols.is_modifier(groups[-1][0]):
+            groups[-1].append(symbol)
+        else:
+            groups.append([symbol])
+
+    return [tuple(group) for group in groups]
+
+def group_matches(query_group, group, variants):
+    if variants and len(query_group) == 1:
+        # A plain symbol also finds it with any fill or rotation
+        return group[0] == query_group[0]
+
+    return group == query_group
+
+class OccurrenceIndex():
+    """Inverted index from every symbol to the cells that hold it.
+
+    It is updated from the 'cell-changed', 'resized' and 'reset' signals
+    of the document, an edit costs the length of the edited cell.
+    """
+
+    def __init__(self, document):
+        self.document = document
+        # symbol -> set of (row, column)
+        self.cells = dict()
+        # (row, column) -> set of the symbols indexed for that cell
+        self.cell_symbols = dict()
+
+        document.connect('cell-changed', self.on_cell_changed)
+        document.connect('resized', self.on_document_resized)
+        document.connect('reset', self.rebuild)
+        self.rebuild()
+
+    def rebuild(self):
+        self.cells.clear()
+        self.cell_symbols.clear()
+
+        for row in range(self.document.row_quantity):
+            for column in range(self.document.column_quantity):
+                self.on_cell_changed(row, column)
+
+    def on_cell_changed(self, row, column):
+        position = (row, column)
+        old = self.cell_symbols.pop(position, set())
+        new = set(self.document.get_symbols(row, column))
+
+        for symbol in old - new:
+            cells = self.cells[symbol]
+            cells.discard(position)
+
+            if not cells:
+                del self.cells[symbol]
+
+        for symbol in new - old:
+            self.cells.setdefault(symbol, set()).add(position)
+
+        if new:
+            self.cell_symbols[position] = new
+
+    def on_document_resized(self, old_row_quantity, old_column_quantity):
+        row_quantity = self.document.row_quantity
+        column_quantity = self.document.column_quantity
+
+        # Only the cells that were cut off are forgotten
+        dropped = [(row, column) for row in range(row_quantity, old_row_quantity)
+                   for column in range(old_column_quantity)]
+        dropped.extend((row, column) for row in range(min(row_quantity, old_row_quantity))
+                       for column in range(column_quantity, old_column_quantity))
+
+        for position in dropped:
+            for symbol in self.cell_symbols.pop(position, ()):
+                cells = self.cells[symbol]
+                cells.discard(position)
+
+                if not cells:
+                    del self.cells[symbol]
+
+    def candidates(self, query):
+        # The cells that hold every symbol of query, from the smallest set
+
+        sets = list()
+
+        for symbol in set(query):
+            cells = self.cells.get(symbol)
+
+            if not cells:
+                return set()
+
+            sets.append(cells)
+
+        sets.sort(key=len)
+
+        return sets[0].intersection(*sets[1:])
+
+    def find(self, query, variants=False):
+        """Find the occurrences of a symbol sequence.
+
+        Args:
+            query: the symbols to find, modifiers follow their symbol
+            variants: whether a symbol written without modifiers in query
+              also finds it with any fill or rotation
+
+        Returns:
+            a sorted list of (row, column, start, end), start and end being
+            symbol positions in the cell
+        """
+        query_groups = split_groups(query)
+
+        if not query_groups:
+            return list()
+
+        occurrences = list()
+
+        for row, column in sorted(self.candidates(query)):
+            for start, end in self.find_in_cell(self.document.get_symbols(row, column), query_groups, variants):
+                occurrences.append((row, column, start, end))
+
+        return occurrences
+
+    def find_in_cell(self, cell, query_groups, variants):
+        # Yields the (start, end) symbol positions of the matches, left to
+        # right and without overlaps
+
+        groups = split_groups(cell)
+        offsets = [0]
+
+        for group in groups:
+            offsets.append(offsets[-1] + len(group))
+
+        number = 0
+
+        while number + len(query_groups) <= len(groups):
+            if all(group_matches(query_group, groups[number + i], variants)
+                   for i, query_group in enumerate(query_groups)):
+                yield offsets[number], offsets[number + len(query_groups)]
+                number += len(query_groups)
+            else:
+                number += 1
+
+    def replace_all(self, query, replacement, variants=False):
+        """Replace every occurrence of query by replacement.
+
+        When a plain symbol of query matched a symbol with modifiers and
+        the symbol at the same place in replacement is plain too, the
+        modifiers are kept, so a hand shape can be corrected without
+        losing its fill and rotation.
+
+        Returns:
+            the number of occurrences replaced
+        """
+        query_groups = split_groups(query)
+        replacement_groups = split_groups(replacement)
+        keep_modifiers = [len(replacement_groups) == len(query_groups)
+                          and len(group) == 1 and len(query_groups[number]) == 1
+                          for number, group in enumerate(replacement_groups)]
+        changes = list()
+        count = 0
+
+        for (row, column), matches in itertools.groupby(self.find(query, variants),
+                                                        key=lambda occurrence: occurrence[:2]):
+            source = self.document.get_symbols(row, column)
+            cell = list()
+            copied = 0
+
+            for row, column, start, end in matches:
+                cell.extend(source[copied:start])
+                matched_groups = split_groups(source[start:end])
+
+                for number, group in enumerate(replacement_groups):
+                    cell.extend(group)
+
+                    if keep_modifiers[number]:
+                        cell.extend(matched_groups[number][1:])
+
+                copied = end
+                count += 1
+
+            cell.extend(source[copied:])
+            changes.append((row, column, cell))
+
+        # Applied once everything was found, so the index does not change
+        # under the search
+        for row, column, cell in changes:
+            self.document.set_symbols(row, column, cell)
+
+        return count
@@ -0,0 +1,133 @@
+# profiling.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Optional instrumentation of the hot paths, turned on with --profile FILE
+# or the SIGNWRITER_PROFILE environment variable.
+#
+# Nothing is wrapped until enable() is called, so a normal run pays
+# nothing. The trace is written in the Trace Event format, which can be
+# opened in https://ui.perfetto.dev or chrome://tracing.
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+ENVIRONMENT_VARIABLE = 'SIGNWRITER_PROFILE'
+
+profiler = None
+
+class Profiler():
+    def __init__(self, path):
+        self.path = path
+        self.events = list()
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.pid = os.getpid()
+
+    def now(self):
+        # Microseconds since the profiler started
+        return (time.perf_counter() - self.start) * 1e6
+
+    def add(self, name, start, allocated_bytes=None, allocated_blocks=None, **args):
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': start,
+            'dur': self.now() - start,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+            'args': args,
+        }
+
+        if allocated_bytes is not None:
+            event['args']['allocated_bytes'] = allocated_bytes
+            event['args']['allocated_blocks'] = allocated_blocks
+
+        with self.lock:
+            self.events.append(event)
+
+    def span(self, name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = self.now()
+            memory = tracemalloc.get_traced_memory()[0]
+            blocks = sys.getallocatedblocks()
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, start,
+                         allocated_bytes=tracemalloc.get_traced_memory()[0] - memory,
+                         allocated_blocks=sys.getallocatedblocks() - blocks)
+
+        return wrapper
+
+    def write(self):
+        with self.lock:
+            events = list(self.events)
+
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def summary(self):
+        # One line per instrumented name, for the About dialog
+
+        totals = dict()
+
+        with self.lock:
+            for event in self.events:
+                count, duration, longest, allocated = totals.get(event['name'], (0, 0, 0, 0))
+                totals[event['name']] = (count + 1,
+                                         duration + event['dur'],
+                                         max(longest, event['dur']),
+                                         allocated + event['args'].get('allocated_bytes', 0))
+
+        lines = [f'Trace file (written on quit): {self.path}', '']
+
+        for name, (count, duration, longest, allocated) in sorted(totals.items()):
+            lines.append(f'{name}: {count} calls, {duration / 1000:.1f} ms total, '
+                         f'{longest / 1000:.1f} ms max, {allocated / 1024:.1f} KiB allocated')
+
+        return '\n'.join(lines)
+
+def enable(path):
+    global profiler
+
+    if profiler is None:
+        tracemalloc.start()
+        profiler = Profiler(path)
+
+    return profiler
+
+def instrument(owner, attribute, name=None):
+    """Replace owner.attribute with a version that records a trace span.
+
+    Must be called after enable() and before the objects that connect the
+    function as a callback are created.
+    """
+    function = getattr(owner, attribute)
+    setattr(owner, attribute, profiler.span(name or attribute, function))
+
+def write():
+    if profiler is not None:
+        profiler.write()
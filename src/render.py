@@ -0,0 +1,412 @@
+# render.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Drawing of the pages, as one pdf or as one svg or png file per page.
+# This module must not import Gtk or Adw, it is shared by the window and
+# by the command line renderer.
+
+import gi
+
+gi.require_version('Pango', '1.0')
+gi.require_version('PangoCairo', '1.0')
+
+from gi.repository import Pango, PangoCairo
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+import cairo, math, os, threading
+from . import profiling
+
+MARGIN_X = 10
+MARGIN_Y = 50
+ROW_SPACING = 70
+
+class LayoutCache():
+    """Bounded LRU cache of shaped cells.
+
+    Sign transcripts repeat the same symbols all the time, so every
+    (text, font) pair is shaped once and recorded into a cairo recording
+    surface that later cells replay. The cache lives as long as the
+    process, so it is shared by every export of the session.
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, font_desc):
+        # Returns the recording surface and the pixel size of the text
+
+        key = (text, font_desc.to_string())
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+
+        recording = cairo.RecordingSurface(cairo.Content.COLOR_ALPHA, None)
+        context = cairo.Context(recording)
+        layout = PangoCairo.create_layout(context)
+        layout.set_font_description(font_desc)
+        layout.set_text(text, -1)
+        PangoCairo.show_layout(context, layout)
+        entry = (recording, *layout.get_pixel_size())
+
+        with self.lock:
+            self.entries[key] = entry
+
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+        return entry
+
+    def get_counters(self):
+        with self.lock:
+            return self.hits, self.misses
+
+layout_cache = LayoutCache()
+
+FORMATS = ('pdf', 'svg', 'png')
+DEFAULT_DPI = 150
+
+# Every page worker thread keeps its own cache, cairo surfaces are not
+# shared between threads
+thread_caches = threading.local()
+
+# Page worker pools by size, kept for the whole process so the caches of
+# their threads are still warm for the next export
+executors = dict()
+executors_lock = threading.Lock()
+
+def get_thread_cache():
+    cache = getattr(thread_caches, 'cache', None)
+
+    if cache is None:
+        cache = thread_caches.cache = LayoutCache()
+
+    return cache
+
+def get_executor(workers):
+    with executors_lock:
+        executor = executors.get(workers)
+
+        if executor is None:
+            executor = executors[workers] = ThreadPoolExecutor(max_workers=workers,
+                                                               thread_name_prefix='signwriter-page')
+
+        return executor
+
+def render_pdf(target, document, cancellable=None, progress=None):
+    """Write the document as a pdf.
+
+    Args:
+        target: a file name or an object with a write() method
+        document: the Document to render
+        cancellable: an optional Gio.Cancellable checked between rows
+        progress: an optional function called with the done fraction
+
+    Returns:
+        the layout cache hits and misses of this export
+    """
+    surface = cairo.PDFSurface(target, document.page_width, document.page_height)
+
+    try:
+        return draw_pages(surface,
+                   document.iter_rows(),
+                   document.row_quantity,
+                   document.column_quantity,
+                   document.page_width,
+                   document.page_height,
+                   document.font_size,
+                   cancellable,
+                   progress)
+    finally:
+        surface.finish()
+
+def draw_pages(surface, rows, row_quantity, column_quantity, page_width, page_height, font_size, cancellable=None, progress=None):
+    """Draw the rows on as many pages as needed.
+
+    Args:
+        surface: the cairo surface, a new page is started when a row does
+          not fit in the current one
+        rows: an iterable with a list of cell texts for every row
+        row_quantity: the number of rows, used for the progress
+        cancellable: an optional Gio.Cancellable checked between rows
+        progress: an optional function called with the done fraction
+
+    Returns:
+        the layout cache hits and misses of this export
+    """
+    column_width = (page_width - 2*MARGIN_X) / column_quantity
+
+    context = cairo.Context(surface)
+    font_desc = get_font_description(font_size)
+
+    y = MARGIN_Y
+    draw_column_dividers(context, column_width, column_quantity, page_height)
+
+    reported_progress = 0
+    start_hits, start_misses = layout_cache.get_counters()
+    profiler = profiling.profiler
+
+    for row, cells in enumerate(rows):
+        if cancellable is not None:
+            cancellable.set_error_if_cancelled()
+
+        if profiler is not None:
+            layout_start = profiler.now()
+
+        layouts = [layout_cache.get(text, font_desc) for text in cells]
+
+        if profiler is not None:
+            profiler.add('pdf-row-layout', layout_start, row=row)
+
+        row_height = max(height for recording, width, height in layouts)
+
+        if y > MARGIN_Y and y + row_height > page_height - MARGIN_Y:
+            context.show_page()
+            y = MARGIN_Y
+            draw_column_dividers(context, column_width, column_quantity, page_height)
+
+        draw_row(context, layouts, column_width, y)
+        y += row_height + ROW_SPACING
+
+        # Only report when the progress moves at least 1%
+        if progress is not None:
+            fraction = (row + 1) / row_quantity
+            if fraction - reported_progress >= 0.01:
+                reported_progress = fraction
+                progress(fraction)
+
+    hits, misses = layout_cache.get_counters()
+
+    return hits - start_hits, misses - start_misses
+
+def paginate(rows, page_height, font_size, cache=layout_cache):
+    """Split the rows in pages, the same way draw_pages does.
+
+    Args:
+        cache: the LayoutCache the cells are shaped with, it must belong
+          to the calling thread when other threads draw at the same time
+
+    Returns:
+        a list with the (first, end) row range of every page
+    """
+    font_desc = get_font_description(font_size)
+    return break_pages([row_height(cells, font_desc, cache) for cells in rows], page_height)
+
+def row_height(cells, font_desc, cache=layout_cache):
+    return max(height for recording, width, height in (cache.get(text, font_desc) for text in cells))
+
+def measure_rows(rows, font_size):
+    """The height of every row, as the pages lay them out, without
+    recording the cells. Each different text is shaped once.
+    """
+    layout = Pango.Layout.new(PangoCairo.FontMap.get_default().create_context())
+    layout.set_font_description(get_font_description(font_size))
+    text_heights = dict()
+    heights = list()
+
+    for cells in rows:
+        row_height = 0
+
+        for text in cells:
+            height = text_heights.get(text)
+
+            if height is None:
+                layout.set_text(text, -1)
+                height = text_heights[text] = layout.get_pixel_size()[1]
+
+            row_height = max(row_height, height)
+
+        heights.append(row_height)
+
+    return heights
+
+def break_pages(row_heights, page_height):
+    # The (first, end) row range of every page, from the height of every row
+
+    pages = list()
+    first = 0
+    y = MARGIN_Y
+
+    for row, height in enumerate(row_heights):
+        if y > MARGIN_Y and y + height > page_height - MARGIN_Y:
+            pages.append((first, row))
+            first = row
+            y = MARGIN_Y
+
+        y += height + ROW_SPACING
+
+    if row_heights:
+        pages.append((first, len(row_heights)))
+
+    return pages
+
+def draw_page(context, rows, column_quantity, page_width, page_height, font_size, cache):
+    # Draws the rows of one page on any cairo context, returns nothing
+
+    column_width = (page_width - 2*MARGIN_X) / column_quantity
+    font_desc = get_font_description(font_size)
+
+    draw_column_dividers(context, column_width, column_quantity, page_height)
+    y = MARGIN_Y
+
+    for cells in rows:
+        layouts = [cache.get(text, font_desc) for text in cells]
+        draw_row(context, layouts, column_width, y)
+        y += max(height for recording, width, height in layouts) + ROW_SPACING
+
+def render_page(path, output_format, rows, column_quantity, page_width, page_height, font_size, dpi, cancellable=None,
+                cache=None):
+    # Writes one svg or png page, with the cache of the calling thread
+    # unless one is given
+
+    if cancellable is not None:
+        cancellable.set_error_if_cancelled()
+
+    if cache is None:
+        cache = get_thread_cache()
+
+    start_hits, start_misses = cache.get_counters()
+
+    if output_format == 'svg':
+        surface = cairo.SVGSurface(path, page_width, page_height)
+        context = cairo.Context(surface)
+    else:
+        scale = dpi / 72
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, math.ceil(page_width * scale), math.ceil(page_height * scale))
+        context = cairo.Context(surface)
+        context.set_source_rgb(1, 1, 1)
+        context.paint()
+        context.set_source_rgb(0, 0, 0)
+        context.scale(scale, scale)
+
+    try:
+        draw_page(context, rows, column_quantity, page_width, page_height, font_size, cache)
+
+        if output_format == 'png':
+            surface.write_to_png(path)
+    finally:
+        surface.finish()
+
+    hits, misses = cache.get_counters()
+
+    return hits - start_hits, misses - start_misses
+
+def page_path(path, number, page_count):
+    # 'out.png' becomes 'out-01.png', 'out-02.png'...
+
+    root, extension = os.path.splitext(path)
+    return f'{root}-{number:0{len(str(page_count))}d}{extension}'
+
+def render_pages(path, output_format, rows, column_quantity, page_width, page_height, font_size,
+                 dpi=DEFAULT_DPI, workers=None, cancellable=None, progress=None):
+    """Write every page in its own svg or png file.
+
+    Pages do not depend on each other, so they are drawn by a pool of
+    threads. Pango and cairo release the GIL while they shape and paint.
+    With a single worker the pages are drawn in the calling thread, from
+    the cells already shaped to split them in pages.
+
+    Args:
+        path: the file name, the page number is added before the extension
+        output_format: 'svg' or 'png'
+        rows: a list with a list of cell texts for every row
+        dpi: the resolution of the png pages
+        workers: the number of threads (default: all cores), 1 when
+          the caller already runs one export per core
+        cancellable: an optional Gio.Cancellable checked between pages
+        progress: an optional function called with the done fraction
+
+    Returns:
+        the layout cache hits and misses of this export
+    """
+    pages = paginate(rows, page_height, font_size)
+    hits = 0
+    misses = 0
+
+    if workers == 1:
+        for number, (first, end) in enumerate(pages):
+            page_hits, page_misses = render_page(page_path(path, number + 1, len(pages)), output_format,
+                                                 rows[first:end], column_quantity, page_width, page_height,
+                                                 font_size, dpi, cancellable, layout_cache)
+            hits += page_hits
+            misses += page_misses
+
+            if progress is not None:
+                progress((number + 1) / len(pages))
+
+        return hits, misses
+
+    executor = get_executor(workers or os.cpu_count())
+    futures = [executor.submit(render_page,
+                               page_path(path, number + 1, len(pages)),
+                               output_format,
+                               rows[first:end],
+                               column_quantity,
+                               page_width,
+                               page_height,
+                               font_size,
+                               dpi,
+                               cancellable)
+               for number, (first, end) in enumerate(pages)]
+
+    try:
+        for done, future in enumerate(as_completed(futures)):
+            page_hits, page_misses = future.result()
+            hits += page_hits
+            misses += page_misses
+
+            if progress is not None:
+                progress((done + 1) / len(pages))
+    except BaseException:
+        for future in futures:
+            future.cancel()
+
+        # The pool outlives the export, pages already being drawn must not
+        # be written after the error is reported
+        wait(futures)
+        raise
+
+    return hits, misses
+
+def get_font_description(font_size):
+    return Pango.FontDescription(f"Noto Sans SignWriting {font_size}")
+
+def draw_row(context, layouts, column_width, y):
+    for i, (recording, width, height) in enumerate(layouts):
+        if width:
+            context.save()
+            context.set_source_surface(recording, MARGIN_X + i * column_width + (column_width - width) / 2, y)
+            context.paint()
+            context.restore()
+
+def draw_column_dividers(context, column_width, column_quantity, page_height):
+    for i in range(1, column_quantity):
+        context.move_to(MARGIN_X + i * column_width, MARGIN_Y)
+        context.line_to(MARGIN_X + i * column_width, page_height - MARGIN_Y)
+        context.stroke()
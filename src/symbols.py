@@ -0,0 +1,220 @@
+# symbols.py
+#
+# Copyright 2024 Schlemuel
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# The catalogue of SignWriting symbols offered by the palette.
+#
+# The symbols are generated once, at import, from the code point ranges
+# of the Sutton SignWriting block (the ISWA symbols). Nothing here imports
+# Gtk, so the command line tools can share it.
+
+import re
+import unicodedata
+
+HAND_FORMAT = 'hand_format'
+MOVEMENT = 'movement'
+SIGN_LOCAL = 'sign_local'
+TRANSFORMATION = 'transformation'
+
+CATEGORY_NAMES = (HAND_FORMAT, MOVEMENT, SIGN_LOCAL, TRANSFORMATION)
+
+# Inclusive ranges, the gaps are code points the palette leaves out
+CATEGORY_RANGES = {
+    HAND_FORMAT: ((0x1D800, 0x1D904),),
+    MOVEMENT: ((0x1D905, 0x1D9AF), (0x1D9C1, 0x1D9C6), (0x1D9C8, 0x1D9D0), (0x1D9D2, 0x1D9FE)),
+    SIGN_LOCAL: ((0x1D9FF, 0x1D9FF), (0x1DA37, 0x1DA3A), (0x1DA6D, 0x1DA74), (0x1DA76, 0x1DA83),
+                 (0x1DA85, 0x1DA8B)),
+    TRANSFORMATION: ((0x1DA00, 0x1DA0F), (0x1DA11, 0x1DA36), (0x1DA3B, 0x1DA6C), (0x1DA75, 0x1DA75),
+                     (0x1DA84, 0x1DA84)),
+}
+
+# Fill and rotation modifiers change the symbol written before them. The
+# palette shows them on top of a hand so they can be seen.
+MODIFIER_RANGES = ((0x1DA9B, 0x1DA9F), (0x1DAA1, 0x1DAAF))
+MODIFIER_BASE = 0x1D8A6
+FIRST_MODIFIER_BASE = 0x1D888
+
+class PaletteEntry():
+    """A button of the palette.
+
+    display is what the button shows and text is what clicking it writes
+    in the selected cell.
+    """
+
+    __slots__ = ('display', 'text', 'category')
+
+    def __init__(self, display, text, category):
+        self.display = display
+        self.text = text
+        self.category = category
+
+def code_points(ranges):
+    for first, last in ranges:
+        yield from range(first, last + 1)
+
+def build_categories():
+    categories = dict()
+
+    for category in CATEGORY_NAMES:
+        categories[category] = [PaletteEntry(chr(code_point), chr(code_point), category)
+                                for code_point in code_points(CATEGORY_RANGES[category])]
+
+    # The plain hand only introduces the modifiers, it writes nothing
+    transformation = categories[TRANSFORMATION]
+    transformation.append(PaletteEntry(chr(MODIFIER_BASE), '', TRANSFORMATION))
+
+    for code_point in code_points(MODIFIER_RANGES):
+        base = FIRST_MODIFIER_BASE if code_point == MODIFIER_RANGES[0][0] else MODIFIER_BASE
+        transformation.append(PaletteEntry(chr(base) + chr(code_point), chr(code_point), TRANSFORMATION))
+
+    return {category: tuple(entries) for category, entries in categories.items()}
+
+# category -> palette entries, in palette order
+CATEGORIES = build_categories()
+
+# palette display -> modifier written in the cell
+MODIFIERS = {entry.display: entry.text
+             for entry in CATEGORIES[TRANSFORMATION]
+             if len(entry.display) > 1}
+
+# modifier -> palette display
+MODIFIER_DISPLAYS = {text: display for display, text in MODIFIERS.items()}
+
+def is_modifier(character):
+    return character in MODIFIER_DISPLAYS
+
+def name_words(text):
+    # Lower case words of the Unicode names, the group and subgroup of the
+    # ISWA symbol are the first words, as in 'HAND-FIST INDEX'
+
+    words = list()
+
+    for character in text:
+        name = unicodedata.name(character, '').lower()
+        words.extend(word for word in re.split(r'[\s\-]+', name) if word and word != 'signwriting')
+        words.append(f'{ord(character):x}')
+
+    return words
+
+def split_query(query):
+    return [word for word in re.split(r'[\s\-]+', query.lower()) if word]
+
+class SymbolIndex():
+    """Inverted index from word prefixes to palette entries.
+
+    Every prefix of every word of an entry is a key, so a query is a few
+    dict lookups and a set intersection, whatever the number of symbols.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.prefixes = dict()
+
+        for number, entry in enumerate(entries):
+            words = name_words(entry.text) + entry.category.split('_')
+
+            for word in words:
+                for end in range(1, len(word) + 1):
+                    self.prefixes.setdefault(word[:end], set()).add(number)
+
+    def search(self, query):
+        """Find the entries matching every word of query.
+
+        Returns:
+            the set of positions in entries, None when query has no words
+        """
+        words = split_query(query)
+
+        if not words:
+            return None
+
+        matches = list()
+
+        for word in words:
+            numbers = self.prefixes.get(word)
+
+            if not numbers:
+                return set()
+
+            matches.append(numbers)
+
+        matches.sort(key=len)
+
+        return matches[0].intersection(*matches[1:])
+
+# Every symbol that writes something, in palette order
+SEARCH_ENTRIES = tuple(entry
+                       for category in CATEGORY_NAMES
+                       for entry in CATEGORIES[category]
+                       if entry.text)
+
+search_index = None
+
+def get_search_index():
+    # Built on the first search, so it costs nothing at startup
+
+    global search_index
+
+    if search_index is None:
+        search_index = SymbolIndex(SEARCH_ENTRIES)
+
+    return search_index
+
+class FrequentSymbols():
+    """Bounded least frequently used cache of the symbols written.
+
+    Only the capacity most used symbols are counted, when a new one comes
+    in the least used (and among those the oldest) is dropped. Counts are
+    halved once one of them gets large, so old habits fade.
+    """
+
+    def __init__(self, capacity=24, max_count=1000):
+        self.capacity = capacity
+        self.max_count = max_count
+        self.counts = dict()
+        self.clock = 0
+        self.last_used = dict()
+
+    def load(self, items):
+        # items is a list of (text, count), as written by to_list
+
+        for text, count in items[:self.capacity]:
+            self.counts[text] = count
+            self.clock += 1
+            self.last_used[text] = -self.clock
+
+    def to_list(self):
+        return [(text, self.counts[text]) for text in self.top(self.capacity)]
+
+    def use(self, text):
+        self.clock += 1
+
+        if text not in self.counts and len(self.counts) >= self.capacity:
+            evicted = min(self.counts, key=lambda item: (self.counts[item], self.last_used[item]))
+            del self.counts[evicted]
+            del self.last_used[evicted]
+
+        self.counts[text] = self.counts.get(text, 0) + 1
+        self.last_used[text] = self.clock
+
+        if self.counts[text] > self.max_count:
+            for item in self.counts:
+                self.counts[item] = (self.counts[item] + 1) // 2
+
+    def top(self, quantity):
+        return sorted(self.counts, key=lambda item: (-self.counts[item], -self.last_used[item]))[:quantity]
@@ -17,9 +17,17 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from gi.repository import Adw, Gtk, Gio, Gdk, GLib, PangoCairo, Pango
-import io, cairo
+from gi.repository import Adw, Gtk, Gio, Gdk, GLib, GObject
+import bisect, glob, math, os, sys, threading, time
 from locale import gettext as _
+from .document import Document
+from .history import History
+from . import docfile, fsw, profiling, symbols
+from .occurrences import OccurrenceIndex
+
+# Time given to every idle callback that works through a long job in
+# batches, in seconds, so the window keeps drawing frames
+BATCH_TIME = 0.008
 
 @Gtk.Template(resource_path='/io/github/Samuel_Schlemper_Schlemuel/SignWriter/window.ui')
 class SignwriterWindow(Adw.ApplicationWindow):
@@ -31,47 +39,91 @@ class SignwriterWindow(Adw.ApplicationWindow):
     remove_character_button = Gtk.Template.Child()
     break_line_button = Gtk.Template.Child()
     space_button = Gtk.Template.Child()
+    toast_overlay = Gtk.Template.Child()
+    export_revealer = Gtk.Template.Child()
+    export_progress_bar = Gtk.Template.Child()
+    export_cancel_button = Gtk.Template.Child()
+    preview_revealer = Gtk.Template.Child()
 
-    boxes = dict()
     current_box = None
-    text_list = list()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.grid_row_quantity = 8
-        self.grid_column_quantity = 6
-        self.add_grid_size(grid = self.grid,
-                           row_quantity = self.grid_row_quantity,
-                           column_quantity = self.grid_column_quantity,
-                           boxes = True)
-
-        symbol_screen = SymbolScreen(self)
-        self.symbol_screen_grid = symbol_screen.symbol_screen_grid
-
-        scrolled_window = Gtk.ScrolledWindow()
-        scrolled_window.set_child(self.symbol_screen_grid)
-        scrolled_window.set_vexpand(True)
-        scrolled_window.set_hexpand(True)
+        self.document = Document(row_quantity = 8, column_quantity = 6)
+        self.document.connect('cell-changed', self.on_cell_changed)
+        self.document.connect('resized', self.on_document_resized)
+        self.document.connect('reset', self.on_document_reset)
+        self.history = History(self.document)
+        self.occurrences = OccurrenceIndex(self.document)
+
+        # The grid is virtualized, only the cells on screen get a widget
+        self.boxes = dict()
+        # Cells whose label is updated on the next frame
+        self.dirty_cells = set()
+        self.flush_callback = None
+        self.cell_list = CellList(self.document)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect('setup', self.on_cell_setup)
+        factory.connect('bind', self.on_cell_bind)
+        factory.connect('unbind', self.on_cell_unbind)
+
+        self.grid.set_model(Gtk.NoSelection.new(self.cell_list))
+        self.grid.set_factory(factory)
+
+        # One click controller for the whole grid, the cell is found from
+        # the widget under the pointer
+        gesture = Gtk.GestureClick()
+        gesture.connect('pressed', self.select_box)
+        self.grid.add_controller(gesture)
+        self.on_document_reset()
+
+        # The palette is hidden at startup, it is built the first time it
+        # is shown
+        self.palette = None
+        self.preview = None
+
+        self.palette_scrolled_window = Gtk.ScrolledWindow()
+        self.palette_scrolled_window.set_vexpand(True)
+        self.palette_scrolled_window.set_hexpand(True)
 
         self.revealer = Gtk.Revealer()
-        self.revealer.set_child(scrolled_window)
+        self.revealer.set_child(self.palette_scrolled_window)
         self.revealer.set_reveal_child(False)
         self.revealer.set_vexpand(True)
         self.revealer.set_hexpand(True)
 
         self.symbol_screen.append(self.revealer)
 
-        self.page_width = 595
-        self.page_height = 842
-        self.font_size = 20
-
         save_file = SaveFile(self)
+        self.storage = DocumentStorage(self)
+        sign_import = SignImport(self)
 
         kwargs['application'].create_action('change-grid-size', self.change_grid_size)
         kwargs['application'].create_action('change-font-size', self.change_font_size)
         kwargs['application'].create_action('change-pdf-size', self.change_pdf_size)
         kwargs['application'].create_action('save-pdf', save_file.dialog)
+        kwargs['application'].create_action('export-png', save_file.export_png)
+        kwargs['application'].create_action('export-svg', save_file.export_svg)
+        kwargs['application'].create_action('print', self.print_document, ['<primary>p'])
+        kwargs['application'].create_action('preview', self.toggle_preview)
+        kwargs['application'].create_action('find', self.find_and_replace, ['<primary>f'])
+        kwargs['application'].create_action('open', self.storage.open_dialog, ['<primary>o'])
+        kwargs['application'].create_action('save', self.storage.save_dialog, ['<primary>s'])
+        kwargs['application'].create_action('import', sign_import.dialog)
+        self.undo_action = kwargs['application'].create_action('undo', self.undo, ['<primary>z'])
+        self.redo_action = kwargs['application'].create_action('redo', self.redo, ['<primary><shift>z'])
+
+        # Turned off by set_editable() while an import fills the grid
+        self.editable = True
+        self.edit_actions = [kwargs['application'].lookup_action(name)
+                             for name in ('change-grid-size', 'find', 'open', 'import')]
+
+        # Connected after the history, so it sees the stacks already changed
+        self.document.connect('edited', self.update_history_actions)
+        self.document.connect('reset', self.update_history_actions)
+        self.update_history_actions()
 
         self.symbol_screen_button.connect('clicked', self.push_screen)
         self.remove_character_button.connect('clicked', self.back_space)
@@ -79,36 +131,89 @@ class SignwriterWindow(Adw.ApplicationWindow):
         self.space_button.connect('clicked', self.space)
 
         self.add_controller(self.create_shortcut_controller())
+        self.connect('close-request', self.storage.save)
+
+    def on_document_reset(self):
+        self.current_box = None
+        self.cell_list.reset()
+
+        self.grid.set_min_columns(self.document.column_quantity)
+        self.grid.set_max_columns(self.document.column_quantity)
+
+    def on_document_resized(self, old_row_quantity, old_column_quantity):
+        if self.current_box != None:
+            row, column = self.current_box
+
+            if row >= self.document.row_quantity or column >= self.document.column_quantity:
+                self.current_box = None
+
+        self.cell_list.resize(old_row_quantity, old_column_quantity)
+
+        self.grid.set_min_columns(self.document.column_quantity)
+        self.grid.set_max_columns(self.document.column_quantity)
+
+    def on_cell_changed(self, row, column):
+        # Labels are only set once per frame, however many symbols were
+        # written in it (a paste, an import, undoing a group)
+        self.dirty_cells.add((row, column))
 
-    def add_grid_size(self, grid, row_quantity, column_quantity, boxes):
-        for num in range(row_quantity):
-            grid.insert_row(num)
+        if self.flush_callback is None:
+            self.flush_callback = self.grid.add_tick_callback(self.flush_dirty_cells)
 
-        for num in range(column_quantity):
-            grid.insert_column(num)
+    def flush_dirty_cells(self, widget, frame_clock):
+        self.flush_callback = None
 
-        if boxes:
-            self.text_list = list()
+        for cell in self.dirty_cells:
+            # Cells scrolled out of view have no widget, bind reads their text
+            box = self.boxes.get(cell)
 
-        for row in range(row_quantity):
-            for column in range(column_quantity):
-                box = Gtk.Box()
+            if box is not None:
+                box.get_last_child().set_text(self.document.get_text(*cell))
 
-                gesture = Gtk.GestureClick()
-                gesture.connect("pressed", self.select_box)
-                gesture.id = f'{column}_{row}'
-                box.add_controller(gesture)
+        self.dirty_cells.clear()
 
-                if boxes:
-                    label = Gtk.Label()
-                    label.get_style_context().add_class('character_label')
-                    box.append(label)
-                    self.text_list.append('')
+        return GLib.SOURCE_REMOVE
 
-                    box.get_style_context().add_class('box')
-                    self.boxes[f'{column}_{row}'] = box
+    def on_cell_setup(self, factory, list_item):
+        label = Gtk.Label()
+        label.get_style_context().add_class('character_label')
 
-                grid.attach(box, column, row, 1, 1)
+        box = Gtk.Box()
+        box.append(label)
+        box.get_style_context().add_class('box')
+        box.cell = None
+
+        list_item.set_child(box)
+
+    def on_cell_bind(self, factory, list_item):
+        cell = list_item.get_item()
+        box = list_item.get_child()
+        box.cell = (cell.row, cell.column)
+        box.get_last_child().set_text(self.document.get_text(cell.row, cell.column))
+        self.boxes[box.cell] = box
+
+        if self.current_box == box.cell:
+            box.get_style_context().add_class('yellow')
+        else:
+            box.get_style_context().remove_class('yellow')
+
+    def on_cell_unbind(self, factory, list_item):
+        box = list_item.get_child()
+
+        if self.boxes.get(box.cell) is box:
+            del self.boxes[box.cell]
+
+    def set_box_highlight(self, cell, highlight):
+        # Cells scrolled out of view have no widget, bind restores their style
+        box = self.boxes.get(cell)
+
+        if box is None:
+            return
+
+        if highlight:
+            box.get_style_context().add_class('yellow')
+        else:
+            box.get_style_context().remove_class('yellow')
 
     def change_grid_size(self, *args):
         dialog = GridSizeDialog(self)
@@ -122,9 +227,20 @@ class SignwriterWindow(Adw.ApplicationWindow):
         dialog = PdfSizeDialog(self)
         dialog.show()
 
+    def print_document(self, *args):
+        DocumentPrint(self).run()
+
+    def find_and_replace(self, *args):
+        dialog = FindDialog(self)
+        dialog.show()
+
     def push_screen(self, widget):
         # Push the button screen with the symbols
 
+        if self.palette is None:
+            self.palette = SymbolScreen(self)
+            self.palette_scrolled_window.set_child(self.palette.symbol_screen_box)
+
         current_reveal_state = self.revealer.get_reveal_child()
 
         if not current_reveal_state:
@@ -138,104 +254,122 @@ class SignwriterWindow(Adw.ApplicationWindow):
 
         self.revealer.set_reveal_child(not current_reveal_state)
 
-    def select_box(self, gesture, *args):
-        #Activated when the user clicks in a box
+    def show_error(self, message):
+        print(message, file=sys.stderr)
+        self.toast_overlay.add_toast(Adw.Toast.new(message))
+
+    def toggle_preview(self, *args):
+        # Like the palette, the preview is only built when first shown
+
+        if self.preview is None:
+            self.preview = PreviewPane(self)
+            self.preview_revealer.set_child(self.preview.scrolled_window)
+
+        self.preview_revealer.set_reveal_child(not self.preview_revealer.get_reveal_child())
 
-        marked = dict()
+    def select_box(self, gesture, clicks, horizontal, vertical):
+        #Activated when the user clicks in the grid
+
+        cell = pick_attribute(self.grid, horizontal, vertical, 'cell')
+
+        if cell is not None:
+            self.select_cell(*cell)
+
+    def select_cell(self, row, column):
+        cell = (row, column)
+        self.history.break_merge()
 
         if self.current_box == None:
-            self.boxes[gesture.id].get_style_context().add_class('yellow')
-            self.current_box = gesture.id
-        elif self.current_box == gesture.id:
-            self.boxes[self.current_box].get_style_context().remove_class('yellow')
+            self.set_box_highlight(cell, True)
+            self.current_box = cell
+        elif self.current_box == cell:
+            self.set_box_highlight(self.current_box, False)
             self.current_box = None
         else:
-            self.boxes[self.current_box].get_style_context().remove_class('yellow')
-            self.boxes[gesture.id].get_style_context().add_class('yellow')
-            self.current_box = gesture.id
+            self.set_box_highlight(self.current_box, False)
+            self.set_box_highlight(cell, True)
+            self.current_box = cell
 
-    def back_space(self, *args):
-        if self.current_box != None:
-            box = self.boxes[self.current_box]
-            label = box.get_last_child()
-            current_text = label.get_label()
-            new_text = current_text[:-1]
-            label.set_text(new_text)
+    def undo(self, *args):
+        self.history.undo()
+        self.update_history_actions()
 
-            position = int(self.current_box[2]) * self.grid_column_quantity + int(self.current_box[0])
-            self.text_list[position] = self.text_list[position][:-1]
+    def redo(self, *args):
+        self.history.redo()
+        self.update_history_actions()
 
-    def break_line(self, *args):
-        if self.current_box != None:
-            box = self.boxes[self.current_box]
-            label = box.get_last_child()
-            current_text = label.get_label()
-            new_text = current_text + '\n'
-            label.set_text(new_text)
+    def update_history_actions(self, *args):
+        self.undo_action.set_enabled(self.editable and self.history.can_undo())
+        self.redo_action.set_enabled(self.editable and self.history.can_redo())
 
-            position = int(self.current_box[2]) * self.grid_column_quantity + int(self.current_box[0])
-            self.text_list[position] += '\n'
+    def set_editable(self, editable):
+        # An import keeps its undo group open across idle callbacks, edits
+        # made meanwhile would be grouped with it and cancelled with it
+        self.editable = editable
 
-    def space(self, *args):
-        if self.current_box != None:
-            box = self.boxes[self.current_box]
-            label = box.get_last_child()
-            current_text = label.get_label()
-            new_text = current_text + '\u2004'
-            label.set_text(new_text)
+        for action in self.edit_actions:
+            action.set_enabled(editable)
+
+        for widget in (self.revealer, self.symbol_screen_button, self.remove_character_button,
+                       self.break_line_button, self.space_button):
+            widget.set_sensitive(editable)
+
+        self.update_history_actions()
+
+    def back_space(self, *args):
+        if self.current_box != None and self.editable:
+            self.document.pop(*self.current_box)
+
+    def break_line(self, *args):
+        if self.current_box != None and self.editable:
+            self.document.append(*self.current_box, '\n')
 
-            position = int(self.current_box[2]) * self.grid_column_quantity + int(self.current_box[0])
-            self.text_list[position] += '\u2004'
+    def space(self, *args):
+        if self.current_box != None and self.editable:
+            self.document.append(*self.current_box, '\u2004')
 
     def right(self, *args):
         if self.current_box != None:
-            gesture = Gtk.GestureClick()
+            row, column = self.current_box
 
-            if self.current_box[0] == f'{self.grid_column_quantity - 1}':
-                if self.current_box[2] == f'{self.grid_row_quantity - 1}':
-                    gesture.id = '0_0'
-                else:
-                    gesture.id = f'0_{int(self.current_box[2]) + 1}'
+            if column == self.document.column_quantity - 1:
+                column = 0
+                row = (row + 1) % self.document.row_quantity
             else:
-                gesture.id = f'{int(self.current_box[0]) + 1}_{self.current_box[2]}'
+                column += 1
 
-            self.select_box(gesture)
+            self.move_selection(row, column)
 
     def left(self, *args):
         if self.current_box != None:
-            gesture = Gtk.GestureClick()
+            row, column = self.current_box
 
-            if self.current_box[0] == '0':
-                if self.current_box[2] == f'0':
-                    gesture.id = f'{self.grid_column_quantity - 1}_{self.grid_row_quantity - 1}'
-                else:
-                    gesture.id = f'{self.grid_column_quantity - 1}_{int(self.current_box[2]) - 1}'
+            if column == 0:
+                column = self.document.column_quantity - 1
+                row = (row - 1) % self.document.row_quantity
             else:
-                gesture.id = f'{int(self.current_box[0]) - 1}_{self.current_box[2]}'
+                column -= 1
 
-            self.select_box(gesture)
+            self.move_selection(row, column)
 
     def up(self, *args):
         if self.current_box != None:
-            gesture = Gtk.GestureClick()
-
-            if self.current_box[2] == f'0':
-                gesture.id = f'{self.current_box[0]}_{self.grid_row_quantity - 1}'
-            else:
-                gesture.id = f'{self.current_box[0]}_{int(self.current_box[2]) - 1}'
-
-            self.select_box(gesture)
+            row, column = self.current_box
+            self.move_selection((row - 1) % self.document.row_quantity, column)
 
     def down(self, *args):
-         if self.current_box != None:
-            gesture = Gtk.GestureClick()
+        if self.current_box != None:
+            row, column = self.current_box
+            self.move_selection((row + 1) % self.document.row_quantity, column)
 
-            if self.current_box[2] == f'{self.grid_row_quantity - 1}':
-                gesture.id = f'{self.current_box[0]}_0'
-            else:
-                gesture.id = f'{self.current_box[0]}_{int(self.current_box[2]) + 1}'
+    def move_selection(self, row, column):
+        # Keyboard moves only change indices, the grid view scrolls so the
+        # selected cell has a widget and is seen. Unlike a click, moving to
+        # the cell already selected keeps it selected.
+        if self.current_box != (row, column):
+            self.select_cell(row, column)
 
-            self.select_box(gesture)
+        self.grid.scroll_to(row * self.document.column_quantity + column, Gtk.ListScrollFlags.NONE, None)
 
     def create_shortcut_controller(self):
         shortcut_controller = Gtk.ShortcutController.new()
@@ -291,12 +425,15 @@ class GridSizeDialog(Gtk.Dialog):
         super().__init__(title=_("Change grid size"), transient_for=parent, modal=True)
         self.parent = parent
 
-        adjustment_row = Gtk.Adjustment(value=1, lower=1, upper=999, step_increment=1, page_increment=10, page_size=0)
+        # Imports may make the grid longer than the usual limit, it must not
+        # be cut when only the columns change
+        row_limit = max(999, self.parent.document.row_quantity)
+        adjustment_row = Gtk.Adjustment(value=self.parent.document.row_quantity, lower=1, upper=row_limit, step_increment=1, page_increment=10, page_size=0)
         self.spin_button_row = Gtk.SpinButton()
         self.spin_button_row.set_adjustment(adjustment_row)
         self.spin_button_row.set_numeric(True)
 
-        adjustment_column = Gtk.Adjustment(value=1, lower=1, upper=10, step_increment=1, page_increment=10, page_size=0)
+        adjustment_column = Gtk.Adjustment(value=self.parent.document.column_quantity, lower=1, upper=10, step_increment=1, page_increment=10, page_size=0)
         self.spin_button_column = Gtk.SpinButton()
         self.spin_button_column.set_adjustment(adjustment_column)
         self.spin_button_column.set_numeric(True)
@@ -318,27 +455,98 @@ class GridSizeDialog(Gtk.Dialog):
         content_area.append(box)
 
     def actualize_grid_size(self, widget):
-        self.remove_grid_children()
-        self.parent.grid_row_quantity = self.spin_button_row.get_value_as_int()
-        self.parent.grid_column_quantity = self.spin_button_column.get_value_as_int()
-        self.parent.add_grid_size(grid = self.parent.grid,
-                                  row_quantity = self.parent.grid_row_quantity,
-                                  column_quantity = self.parent.grid_column_quantity,
-                                  boxes = True)
+        self.parent.document.resize(row_quantity = self.spin_button_row.get_value_as_int(),
+                                    column_quantity = self.spin_button_column.get_value_as_int())
         self.response(Gtk.ResponseType.OK)
         self.close()
 
-    def remove_grid_children(self):
-        # Clean the grid with the boxes
+class FindDialog(Gtk.Dialog):
 
-        self.parent.current_box = None
+    def __init__(self, parent):
+        super().__init__(title=_("Find and replace"), transient_for=parent, modal=False)
+        self.parent = parent
 
-        if self.parent.grid_row_quantity < self.parent.grid_column_quantity:
-            for num in range(self.parent.grid_row_quantity):
-                self.parent.grid.remove_row(0)
-        else:
-            for num in range(self.parent.grid_column_quantity):
-                self.parent.grid.remove_column(0)
+        self.find_entry = Gtk.Entry()
+        self.find_entry.connect('activate', self.find_next)
+        self.replace_entry = Gtk.Entry()
+
+        self.variants_button = Gtk.CheckButton(label=_('Also find the symbols with any fill or rotation'))
+        self.variants_button.set_active(True)
+
+        label_find = Gtk.Label(label=_('Symbols to find, or FSW keys like S10011'))
+        label_replace = Gtk.Label(label=_('Replace with'))
+        self.result_label = Gtk.Label()
+
+        find_button = Gtk.Button(label=_('Find next'))
+        find_button.connect('clicked', self.find_next)
+        replace_button = Gtk.Button(label=_('Replace all'))
+        replace_button.connect('clicked', self.replace_all)
+
+        button_box = Gtk.Box(spacing=6, homogeneous=True)
+        button_box.append(find_button)
+        button_box.append(replace_button)
+
+        box = Gtk.Box(spacing=6, orientation=Gtk.Orientation.VERTICAL)
+        box.append(label_find)
+        box.append(self.find_entry)
+        box.append(label_replace)
+        box.append(self.replace_entry)
+        box.append(self.variants_button)
+        box.append(button_box)
+        box.append(self.result_label)
+
+        content_area = self.get_content_area()
+        content_area.append(box)
+
+    def read_entry(self, entry):
+        # Symbols can be pasted as they are or written as FSW keys
+        text = entry.get_text()
+
+        if text.isascii():
+            return fsw.read_symbol_keys(text)
+
+        return [character for character in text if not character.isspace()]
+
+    def find_next(self, widget):
+        try:
+            query = self.read_entry(self.find_entry)
+        except ValueError as error:
+            self.result_label.set_text(_('Invalid symbols: {}').format(error))
+            return
+
+        occurrences = self.parent.occurrences.find(query, self.variants_button.get_active())
+
+        if not occurrences:
+            self.result_label.set_text(_('Not found'))
+            return
+
+        # The first cell after the selected one, wrapping around
+        current = self.parent.current_box or (-1, -1)
+        cells = [(row, column) for row, column, start, end in occurrences]
+        number = bisect.bisect_right(cells, current) % len(cells)
+
+        self.result_label.set_text(_('{} occurrences').format(len(occurrences)))
+        self.parent.move_selection(*cells[number])
+
+    def replace_all(self, widget):
+        if not self.parent.editable:
+            self.result_label.set_text(_('Wait for the import to finish'))
+            return
+
+        try:
+            query = self.read_entry(self.find_entry)
+            replacement = self.read_entry(self.replace_entry)
+        except ValueError as error:
+            self.result_label.set_text(_('Invalid symbols: {}').format(error))
+            return
+
+        # One undo step for the whole replacement
+        self.parent.history.begin_group()
+        count = self.parent.occurrences.replace_all(query, replacement, self.variants_button.get_active())
+        self.parent.history.end_group()
+        self.parent.update_history_actions()
+
+        self.result_label.set_text(_('{} occurrences replaced').format(count))
 
 class FontSizeDialog(Gtk.Dialog):
 
@@ -346,7 +554,7 @@ class FontSizeDialog(Gtk.Dialog):
         super().__init__(title=_("Change font size"), transient_for=parent, modal=True)
         self.parent = parent
 
-        adjustment = Gtk.Adjustment(value=20, lower=10, upper=50, step_increment=1, page_increment=10, page_size=0)
+        adjustment = Gtk.Adjustment(value=self.parent.document.font_size, lower=10, upper=50, step_increment=1, page_increment=10, page_size=0)
         self.spin_button = Gtk.SpinButton()
         self.spin_button.set_adjustment(adjustment)
         self.spin_button.set_numeric(True)
@@ -365,7 +573,7 @@ class FontSizeDialog(Gtk.Dialog):
         content_area.append(box)
 
     def actualize_font_size(self, widget):
-        self.parent.font_size = self.spin_button.get_value_as_int()
+        self.parent.document.set_font_size(self.spin_button.get_value_as_int())
         self.response(Gtk.ResponseType.OK)
         self.close()
 
@@ -375,12 +583,12 @@ class PdfSizeDialog(Gtk.Dialog):
         super().__init__(title=_("Change pdf size"), transient_for=parent, modal=True)
         self.parent = parent
 
-        adjustment_height = Gtk.Adjustment(value=self.parent.page_height, lower=100, upper=5000, step_increment=20, page_increment=10, page_size=0)
+        adjustment_height = Gtk.Adjustment(value=self.parent.document.page_height, lower=100, upper=5000, step_increment=20, page_increment=10, page_size=0)
         self.spin_button_height = Gtk.SpinButton()
         self.spin_button_height.set_adjustment(adjustment_height)
         self.spin_button_height.set_numeric(True)
 
-        adjustment_width = Gtk.Adjustment(value=self.parent.page_width, lower=100, upper=5000, step_increment=20, page_increment=10, page_size=0)
+        adjustment_width = Gtk.Adjustment(value=self.parent.document.page_width, lower=100, upper=5000, step_increment=20, page_increment=10, page_size=0)
         self.spin_button_width = Gtk.SpinButton()
         self.spin_button_width.set_adjustment(adjustment_width)
         self.spin_button_width.set_numeric(True)
@@ -402,8 +610,8 @@ class PdfSizeDialog(Gtk.Dialog):
         content_area.append(box)
 
     def actualize_pdf_size(self, widget):
-        self.parent.page_height = self.spin_button_height.get_value_as_int()
-        self.parent.page_width = self.spin_button_width.get_value_as_int()
+        self.parent.document.set_page_size(self.spin_button_width.get_value_as_int(),
+                                           self.spin_button_height.get_value_as_int())
         self.response(Gtk.ResponseType.OK)
         self.close()
 
@@ -418,178 +626,242 @@ class SymbolScreen():
         self.sign_local = Gtk.Button(label=_("Signal Location"))
         self.transformation = Gtk.Button(label=_("Transformation"))
 
-        self.hand_format.connect('clicked', self.hand_format_screen)
-        self.movement.connect('clicked', self.movement_screen)
-        self.sign_local.connect('clicked', self.sign_local_screen)
-        self.transformation.connect('clicked', self.transformation_screen)
+        self.hand_format.connect('clicked', self.show_page, symbols.HAND_FORMAT)
+        self.movement.connect('clicked', self.show_page, symbols.MOVEMENT)
+        self.sign_local.connect('clicked', self.show_page, symbols.SIGN_LOCAL)
+        self.transformation.connect('clicked', self.show_page, symbols.TRANSFORMATION)
 
         self.hand_format.get_style_context().add_class('button_content_reveal')
         self.movement.get_style_context().add_class('button_content_reveal')
         self.sign_local.get_style_context().add_class('button_content_reveal')
         self.transformation.get_style_context().add_class('button_content_reveal')
 
-        self.symbol_screen_grid = Gtk.Grid()
-        self.symbol_screen_grid.set_column_homogeneous(True)
-        self.symbol_screen_grid.set_row_homogeneous(True)
-        self.symbol_screen_grid.set_column_spacing(5)
-        self.symbol_screen_grid.set_row_spacing(10)
+        button_box = Gtk.Box(spacing=5, homogeneous=True)
+        button_box.append(self.hand_format)
+        button_box.append(self.movement)
+        button_box.append(self.sign_local)
+        button_box.append(self.transformation)
 
-        self.symbol_screen_grid_row_quantity = 23
-        self.symbol_screen_grid_column_quantity = 12
+        # Every category page is built the first time it is shown and then
+        # kept, switching tabs only changes the visible page
+        self.stack = Gtk.Stack()
+        self.stack.set_vhomogeneous(False)
+
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text(_('Search symbols'))
+        self.search_entry.connect('search-changed', self.search)
+
+        self.symbol_screen_box = Gtk.Box(spacing=10, orientation=Gtk.Orientation.VERTICAL)
+        self.symbol_screen_box.append(self.search_entry)
+        self.symbol_screen_box.append(self.create_frequent_strip())
+        self.symbol_screen_box.append(button_box)
+        self.symbol_screen_box.append(self.stack)
 
-        self.parent.add_grid_size(grid = self.symbol_screen_grid,
-                           row_quantity = self.symbol_screen_grid_row_quantity,
-                           column_quantity = self.symbol_screen_grid_column_quantity,
-                           boxes = False)
+        self.symbol_screen_grid_column_quantity = 12
+        self.current_page = symbols.HAND_FORMAT
+        self.search_matches = set()
+        self.search_filter = None
 
         self.hand_format.emit('clicked')
 
-    def hand_format_screen(self, widget):
-        self.clean_symbol_screen_grid(23)
-
-        characters_list = ['𝠀', '𝠁', '𝠂', '𝠃', '𝠄', '𝠅', '𝠆', '𝠇', '𝠈', '𝠉', '𝠊', '𝠋', '𝠌',
-        '𝠍', '𝠎', '𝠏', '𝠐', '𝠑', '𝠒', '𝠓', '𝠔', '𝠕', '𝠖', '𝠘', '𝠗', '𝠙', '𝠚', '𝠛', '𝠜',
-        '𝠝', '𝠞', '𝠟', '𝠠', '𝠡', '𝠢', '𝠣', '𝠤', '𝠥', '𝠦', '𝠧', '𝠨', '𝠩', '𝠪', '𝠫', '𝠬',
-        '𝠭', '𝠮', '𝠯', '𝠰', '𝠱', '𝠲', '𝠳', '𝠴', '𝠵', '𝠶', '𝠷', '𝠸', '𝠹', '𝠺', '𝠻', '𝠼',
-        '𝠽', '𝠾', '𝠿', '𝡀', '𝡁', '𝡂', '𝡃', '𝡄', '𝡅', '𝡆', '𝡇', '𝡈', '𝡉', '𝡊', '𝡋', '𝡌',
-        '𝡍', '𝡏', '𝡎', '𝡐', '𝡑', '𝡒', '𝡓', '𝡔', '𝡕', '𝡖', '𝡗', '𝡘', '𝡙', '𝡚', '𝡛', '𝡜',
-        '𝡝', '𝡞', '𝡟', '𝡠', '𝡡', '𝡢', '𝡣', '𝡤', '𝡥', '𝡦', '𝡧', '𝡨', '𝡩', '𝡪', '𝡫', '𝡬',
-        '𝡭', '𝡮', '𝡯', '𝡰', '𝡱', '𝡲', '𝡳', '𝡴', '𝡵', '𝡶', '𝡷', '𝡸', '𝡹', '𝡺', '𝡻', '𝡼',
-        '𝡽', '𝡾', '𝡿', '𝢀', '𝢁', '𝢂', '𝢃', '𝢄', '𝢅', '𝢆', '𝢇', '𝢈', '𝢉', '𝢊', '𝢋', '𝢌',
-        '𝢍', '𝢎', '𝢏', '𝢐', '𝢑', '𝢒', '𝢓', '𝢔', '𝢕', '𝢖', '𝢗', '𝢘', '𝢙', '𝢚', '𝢛', '𝢜',
-        '𝢝', '𝢞', '𝢟', '𝢠', '𝢡', '𝢢', '𝢣', '𝢤', '𝢥', '𝢦', '𝢧', '𝢨', '𝢩', '𝢪', '𝢫', '𝢬',
-        '𝢭', '𝢮', '𝢰', '𝢱', '𝢯', '𝢲', '𝢳', '𝢴', '𝢵', '𝢶', '𝢷', '𝢸', '𝢹', '𝢺', '𝢻', '𝢼',
-        '𝢽', '𝢾', '𝢿', '𝣀', '𝣁', '𝣂', '𝣃', '𝣄', '𝣅', '𝣆', '𝣇', '𝣈', '𝣉', '𝣊', '𝣋', '𝣌',
-        '𝣍', '𝣎', '𝣏', '𝣐', '𝣑', '𝣒', '𝣓', '𝣔', '𝣕', '𝣖', '𝣗', '𝣘', '𝣙', '𝣚', '𝣛', '𝣜',
-        '𝣝', '𝣞', '𝣟', '𝣠', '𝣡', '𝣢', '𝣣', '𝣤', '𝣥', '𝣦', '𝣧', '𝣨', '𝣩', '𝣪', '𝣫', '𝣬',
-        '𝣭', '𝣮', '𝣯', '𝣰', '𝣱', '𝣲', '𝣳', '𝣴', '𝣵', '𝣶', '𝣷', '𝣸', '𝣹', '𝣺', '𝣻', '𝣼',
-        '𝣽', '𝣾', '𝣿', '𝤀', '𝤁', '𝤂', '𝤃', '𝤄']
-
-        self.add_characters(characters_list)
-
-    def movement_screen(self, widget):
-        self.clean_symbol_screen_grid(21)
-
-        characters_list = ['𝤅', '𝤆', '𝤇', '𝤈', '𝤉', '𝤊', '𝤋', '𝤌', '𝤍', '𝤎', '𝤏',
-        '𝤐', '𝤑', '𝤒', '𝤓', '𝤔', '𝤔', '𝤕', '𝤖', '𝤗', '𝤘', '𝤙', '𝤚', '𝤛', '𝤜', '𝤝',
-        '𝤞', '𝤟', '𝤠', '𝤡', '𝤢', '𝤣', '𝤤', '𝤥', '𝤦', '𝤧', '𝤨', '𝤩', '𝤪', '𝤫', '𝤬',
-        '𝤭', '𝤮', '𝤯', '𝤰', '𝤱', '𝤳', '𝤲', '𝤴', '𝤵', '𝤶', '𝤷', '𝤸', '𝤹', '𝤺', '𝤻',
-        '𝤼', '𝤽', '𝤾', '𝤿', '𝥀', '𝥁', '𝥂', '𝥃', '𝥄', '𝥅', '𝥆', '𝥇', '𝥈', '𝥉', '𝥊',
-        '𝥋', '𝥌', '𝥍', '𝥎', '𝥏', '𝥐', '𝥑', '𝥒', '𝥓', '𝥔', '𝥕', '𝥗', '𝥖', '𝥘', '𝥙',
-        '𝥚', '𝥛', '𝥜', '𝥝', '𝥞', '𝥟', '𝥠', '𝥡', '𝥢', '𝥤', '𝥣', '𝥥', '𝥦', '𝥧', '𝥨',
-        '𝥩', '𝥪', '𝥫', '𝥬', '𝥭', '𝥮', '𝥯', '𝥰', '𝥱', '𝥲', '𝥳', '𝥴', '𝥵', '𝥶', '𝥷',
-        '𝥸', '𝥹', '𝥻', '𝥺', '𝥼', '𝥾', '𝥽', '𝥿', '𝦀', '𝦁', '𝦂', '𝦃', '𝦄', '𝦅', '𝦆',
-        '𝦇', '𝦈', '𝦉', '𝦊', '𝦋', '𝦌', '𝦍', '𝦎', '𝦏', '𝦐', '𝦑', '𝦒', '𝦓', '𝦔', '𝦕',
-        '𝦖', '𝦗', '𝦘', '𝦚', '𝦙', '𝦛', '𝦜', '𝦝', '𝦞', '𝦟', '𝦠', '𝦡', '𝦢', '𝦣', '𝦤',
-        '𝦥', '𝦦', '𝦧', '𝦨', '𝦩', '𝦪', '𝦫', '𝦬', '𝦭', '𝦮', '𝦯', '𝧁', '𝧂', '𝧃', '𝧄',
-        '𝧅', '𝧆', '𝧈', '𝧉', '𝧊', '𝧋', '𝧌', '𝧍', '𝧎', '𝧏', '𝧐', '𝧒', '𝧓', '𝧔', '𝧕',
-        '𝧖', '𝧗', '𝧘', '𝧙', '𝧚', '𝧛', '𝧜', '𝧝', '𝧞', '𝧟', '𝧠', '𝧡', '𝧢', '𝧣', '𝧤',
-        '𝧥', '𝧦', '𝧧', '𝧨', '𝧩', '𝧪', '𝧫', '𝧬', '𝧭', '𝧮', '𝧯', '𝧰', '𝧱', '𝧲', '𝧳',
-        '𝧴', '𝧵', '𝧶', '𝧷', '𝧸', '𝧹', '𝧺', '𝧻', '𝧼', '𝧽', '𝧾']
-
-        self.add_characters(characters_list)
-
-    def sign_local_screen(self, widget):
-        self.clean_symbol_screen_grid(8)
-
-        characters_list = ['𝧿', '𝨷', '𝨸', '𝨹', '𝨺', '𝩭', '𝩮', '𝩯', '𝩰', '𝩱', '𝩲', '𝩳',
-        '𝩴', '𝩶', '𝩷', '𝩸', '𝩹', '𝩺', '𝩻', '𝩼', '𝩽', '𝩾', '𝩿', '𝪀', '𝪁', '𝪂', '𝪃',
-        '𝪅', '𝪆', '𝪇', '𝪈', '𝪉', '𝪊', '𝪋']
-
-        self.add_characters(characters_list)
-
-    def transformation_screen(self, widget):
-        self.clean_symbol_screen_grid(14)
-
-        characters_list = ['𝨀', '𝨁', '𝨂', '𝨃', '𝨄', '𝨅', '𝨆', '𝨇', '𝨈', '𝨉', '𝨊', '𝨋', '𝨌', '𝨍', '𝨏', '𝨎', '𝨑', '𝨒', '𝨓',
-        '𝨔', '𝨕', '𝨖', '𝨗', '𝨘', '𝨙', '𝨚', '𝨜', '𝨛', '𝨞', '𝨝', '𝨟', '𝨠', '𝨡', '𝨢', '𝨣',
-        '𝨥', '𝨤', '𝨦', '𝨧', '𝨨', '𝨩', '𝨪', '𝨫', '𝨬', '𝨭', '𝨮', '𝨯', '𝨰', '𝨱', '𝨲', '𝨳',
-        '𝨴', '𝨵', '𝨶', '𝨼', '𝨻', '𝨽', '𝨾', '𝨿', '𝩀', '𝩂', '𝩁', '𝩃', '𝩄', '𝩅', '𝩆', '𝩇',
-        '𝩈', '𝩉', '𝩊', '𝩋', '𝩌', '𝩍', '𝩎', '𝩏', '𝩐', '𝩑', '𝩒', '𝩓', '𝩔', '𝩖', '𝩕', '𝩗',
-        '𝩘', '𝩙', '𝩚', '𝩛', '𝩜', '𝩝', '𝩞', '𝩟', '𝩠', '𝩡', '𝩢', '𝩣', '𝩤', '𝩥', '𝩦', '𝩧',
-        '𝩨', '𝩩', '𝩪', '𝩫', '𝩬', '𝩵', '𝪄', '𝢦', '𝢈𝪛', '𝢦𝪜', '𝢦𝪝', '𝢦𝪞', '𝢦𝪟',
-        '𝢦𝪡','𝢦𝪢', '𝢦𝪣', '𝢦𝪤', '𝢦𝪥', '𝢦𝪦', '𝢦𝪧', '𝢦𝪨', '𝢦𝪩', '𝢦𝪪', '𝢦𝪫', '𝢦𝪬', '𝢦𝪭', '𝢦𝪮', '𝢦𝪯']
-
-        self.add_characters(characters_list)
-
-    def clean_symbol_screen_grid(self, new_row_quantity):
-        for row in range(self.symbol_screen_grid_row_quantity):
-            for column in range(self.symbol_screen_grid_column_quantity):
-                child = self.symbol_screen_grid.get_child_at(column, row)
-                self.symbol_screen_grid.remove(child)
-
-                if self.hand_format.get_parent():
-                    self.hand_format.get_parent().remove(self.hand_format)
-
-                if self.movement.get_parent():
-                    self.movement.get_parent().remove(self.movement)
-
-                if self.sign_local.get_parent():
-                    self.sign_local.get_parent().remove(self.sign_local)
-
-                if self.transformation.get_parent():
-                    self.transformation.get_parent().remove(self.transformation)
-
-        self.symbol_screen_grid_row_quantity = new_row_quantity
-
-        self.parent.add_grid_size(grid = self.symbol_screen_grid,
-                           row_quantity = self.symbol_screen_grid_row_quantity,
-                           column_quantity = self.symbol_screen_grid_column_quantity,
-                           boxes = False)
-
-        self.symbol_screen_grid.attach(self.hand_format,       column = 0, row = 0, width = 3, height = 1)
-        self.symbol_screen_grid.attach(self.movement,          column = 3, row = 0, width = 3, height = 1)
-        self.symbol_screen_grid.attach(self.sign_local,        column = 6, row = 0, width = 3, height = 1)
-        self.symbol_screen_grid.attach(self.transformation,    column = 9, row = 0, width = 3, height = 1)
-
-    def add_characters(self, characters):
-        row = 1
-        col = 0
+    def create_frequent_strip(self):
+        self.frequent = symbols.FrequentSymbols()
+        self.frequent_save_source = None
+
+        # Without the installed schema (e.g. when running from the source
+        # tree) the frequent symbols are simply not remembered
+        schema_id = 'io.github.Samuel_Schlemper_Schlemuel.SignWriter'
+        schema_source = Gio.SettingsSchemaSource.get_default()
+
+        if schema_source is not None and schema_source.lookup(schema_id, True) is not None:
+            self.settings = Gio.Settings.new(schema_id)
+            self.frequent.load(self.settings.get_value('frequent-symbols').unpack())
+        else:
+            self.settings = None
+
+        strip = Gtk.Box(spacing=5, homogeneous=True)
+        self.frequent_boxes = list()
 
-        for char in characters:
-            label = Gtk.Label(label=char)
+        for num in range(self.symbol_screen_grid_column_quantity):
+            label = Gtk.Label()
             label.get_style_context().add_class('character_label')
 
             box = Gtk.Box()
             box.append(label)
+            box.text = ''
+
+            strip.append(box)
+            self.frequent_boxes.append(box)
+
+        strip.add_controller(self.create_palette_controller())
+
+        self.frequent_top = None
+        self.update_frequent_strip()
+
+        frequent_label = Gtk.Label(label=_('Frequent'))
+        frequent_label.set_halign(Gtk.Align.START)
+
+        frequent_box = Gtk.Box(spacing=5, orientation=Gtk.Orientation.VERTICAL)
+        frequent_box.append(frequent_label)
+        frequent_box.append(strip)
+
+        self.parent.connect('close-request', self.save_frequent)
+
+        return frequent_box
+
+    def update_frequent_strip(self):
+        top = self.frequent.top(len(self.frequent_boxes))
+
+        if top == self.frequent_top:
+            return
+
+        self.frequent_top = top
+
+        for num, box in enumerate(self.frequent_boxes):
+            if num < len(top):
+                box.get_last_child().set_text(symbols.MODIFIER_DISPLAYS.get(top[num], top[num]))
+                box.text = top[num]
+                box.set_visible(True)
+            else:
+                box.text = ''
+                box.set_visible(False)
 
-            gesture = Gtk.GestureClick()
-            gesture.connect("pressed", self.select_character)
-            gesture.id = f'{char}'
-            box.add_controller(gesture)
+    def schedule_frequent_save(self):
+        # Many clicks in a row end up in a single write
 
-            child = self.symbol_screen_grid.get_child_at(col, row)
-            self.symbol_screen_grid.remove(child)
-            self.symbol_screen_grid.attach(box, col, row, 1, 1)
+        if self.settings is not None and self.frequent_save_source is None:
+            self.frequent_save_source = GLib.timeout_add_seconds(5, self.on_frequent_save_timeout)
+
+    def on_frequent_save_timeout(self):
+        self.frequent_save_source = None
+        self.save_frequent()
+        return GLib.SOURCE_REMOVE
+
+    def save_frequent(self, *args):
+        if self.frequent_save_source is not None:
+            GLib.source_remove(self.frequent_save_source)
+            self.frequent_save_source = None
+
+        if self.settings is not None:
+            self.settings.set_value('frequent-symbols', GLib.Variant('a(si)', self.frequent.to_list()))
+
+        return False
+
+    def show_page(self, widget, name):
+        if self.stack.get_child_by_name(name) is None:
+            self.stack.add_named(self.create_page(symbols.CATEGORIES[name]), name)
+
+        self.current_page = name
+        self.search_entry.set_text('')
+        self.stack.set_visible_child_name(name)
+
+    def search(self, entry):
+        matches = symbols.get_search_index().search(entry.get_text())
+
+        if matches is None:
+            self.stack.set_visible_child_name(self.current_page)
+            return
+
+        if self.search_filter is None:
+            self.stack.add_named(self.create_search_page(), 'search')
+
+        self.search_matches = matches
+        self.search_filter.changed(Gtk.FilterChange.DIFFERENT)
+        self.stack.set_visible_child_name('search')
+
+    def create_search_page(self):
+        # Every symbol is in one list, typing only changes which of them
+        # the filter lets through
+
+        store = Gio.ListStore.new(PaletteItem)
+
+        for number, entry in enumerate(symbols.SEARCH_ENTRIES):
+            store.append(PaletteItem(number, entry))
+
+        self.search_filter = Gtk.CustomFilter.new(lambda item: item.number in self.search_matches)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect('setup', self.on_search_item_setup)
+        factory.connect('bind', self.on_search_item_bind)
+
+        grid_view = Gtk.GridView()
+        grid_view.set_model(Gtk.NoSelection.new(Gtk.FilterListModel.new(store, self.search_filter)))
+        grid_view.set_factory(factory)
+        grid_view.set_min_columns(self.symbol_screen_grid_column_quantity)
+        grid_view.set_max_columns(self.symbol_screen_grid_column_quantity)
+        grid_view.set_can_focus(False)
+        grid_view.add_controller(self.create_palette_controller())
+
+        return grid_view
+
+    def on_search_item_setup(self, factory, list_item):
+        label = Gtk.Label()
+        label.get_style_context().add_class('character_label')
+
+        box = Gtk.Box()
+        box.append(label)
+        box.text = ''
+
+        list_item.set_child(box)
+
+    def on_search_item_bind(self, factory, list_item):
+        entry = list_item.get_item().entry
+        box = list_item.get_child()
+        box.get_last_child().set_text(entry.display)
+        box.text = entry.text
+
+    def create_page(self, entries):
+        grid = Gtk.Grid()
+        grid.set_column_homogeneous(True)
+        grid.set_row_homogeneous(True)
+        grid.set_column_spacing(5)
+        grid.set_row_spacing(10)
+
+        row = 0
+        col = 0
+
+        for entry in entries:
+            label = Gtk.Label(label=entry.display)
+            label.get_style_context().add_class('character_label')
+
+            box = Gtk.Box()
+            box.append(label)
+            box.text = entry.text
+
+            grid.attach(box, col, row, 1, 1)
             col += 1
 
             if col >= self.symbol_screen_grid_column_quantity:
                 col = 0
                 row += 1
 
-    def select_character(self, gesture, clicks, horizontal, vertical):
-        if self.parent.current_box != None:
-            box = self.parent.boxes[self.parent.current_box]
-            label = box.get_last_child()
-            current_text = label.get_label()
-            character = gesture.id
+        grid.add_controller(self.create_palette_controller())
 
-            change = ['𝢦', '𝢈𝪛', '𝢦𝪜', '𝢦𝪝', '𝢦𝪞', '𝢦𝪟', '𝢦𝪡','𝢦𝪢', '𝢦𝪣', '𝢦𝪤',
-                      '𝢦𝪥', '𝢦𝪦', '𝢦𝪧', '𝢦𝪨', '𝢦𝪩', '𝢦𝪪', '𝢦𝪫', '𝢦𝪬', '𝢦𝪭', '𝢦𝪮', '𝢦𝪯']
+        return grid
 
-            to = ['', '𝪛', '𝪜', '𝪝', '𝪞', '𝪟', '𝪡', '𝪢', '𝪣', '𝪤', '𝪥', '𝪦', '𝪧', '𝪨', '𝪩', '𝪪', '𝪫', '𝪬', '𝪭', '𝪮', '𝪯']
+    def create_palette_controller(self):
+        # One controller per page, whatever the number of symbols on it
+        gesture = Gtk.GestureClick()
+        gesture.connect("pressed", self.select_character)
+        return gesture
 
-            if character in change:
-                character = to[change.index(character)]
+    def select_character(self, gesture, clicks, horizontal, vertical):
+        text = pick_attribute(gesture.get_widget(), horizontal, vertical, 'text')
 
-            label.set_text(current_text + character)
+        if self.parent.current_box != None and text:
+            self.parent.document.append(*self.parent.current_box, text)
 
-            position = int(self.parent.current_box[2]) * self.parent.grid_column_quantity + int(self.parent.current_box[0])
-            self.parent.text_list[position] += character
+            self.frequent.use(text)
+            self.update_frequent_strip()
+            self.schedule_frequent_save()
 
 class SaveFile():
     def __init__(self, parent):
         self.parent = parent
+        self.cancellable = None
+        self.start_time = None
+
+        self.parent.export_cancel_button.connect('clicked', self.cancel)
 
     def dialog(self, widget, _):
         file_dialog = Gtk.FileDialog()
@@ -598,69 +870,828 @@ class SaveFile():
         file_dialog.save(self.parent, None, self.on_file_dialog_response)
 
     def on_file_dialog_response(self, dialog, result):
-        file = dialog.save_finish(result)
+        try:
+            file = dialog.save_finish(result)
+        except GLib.Error:
+            # The user closed the dialog without choosing a file
+            return
 
         if file is not None:
           self.create_pdf(file)
 
-    def create_pdf(self, file):
-        x, y = 10, 50
-        page_width = self.parent.page_width
-        page_height = self.parent.page_height
-        column_width = (page_width - 2*x) / self.parent.grid_column_quantity
+    def export_png(self, *args):
+        self.pages_dialog('png')
 
-        output_stream = io.BytesIO()
-        surface = cairo.PDFSurface(output_stream, page_width, page_height)
-        context = cairo.Context(surface)
+    def export_svg(self, *args):
+        self.pages_dialog('svg')
+
+    def pages_dialog(self, output_format):
+        # Every page gets its own file, so a folder is chosen and the pages
+        # are named after the document in it
 
-        layout = PangoCairo.create_layout(context)
-        font_desc = Pango.FontDescription(f"Noto Sans SignWriting {self.parent.font_size}")
-        layout.set_font_description(font_desc)
+        file_dialog = Gtk.FileDialog()
+        file_dialog.set_title(_("Export pages as images"))
+        file_dialog.set_modal(True)
+        file_dialog.select_folder(self.parent, None, self.on_pages_dialog_response, output_format)
+
+    def on_pages_dialog_response(self, dialog, result, output_format):
+        try:
+            folder = dialog.select_folder_finish(result)
+        except GLib.Error:
+            return
+
+        folder_path = folder.get_path()
+
+        if folder_path is None:
+            self.parent.show_error(_('Pages can only be exported to a folder on this computer'))
+            return
+
+        document_file = self.parent.storage.file
+        name = os.path.splitext(os.path.basename(document_file.path))[0] if document_file else 'document'
+        file = Gio.File.new_for_path(os.path.join(folder_path, f'{name}.{output_format}'))
+
+        # render.page_path names the pages 'document-01.png', 'document-02.png'...
+        existing = glob.glob(os.path.join(glob.escape(folder_path), f'{glob.escape(name)}-*.{output_format}'))
+
+        if not existing:
+            self.create_pdf(file, output_format)
+            return
+
+        dialog = Adw.AlertDialog.new(_('Replace the exported pages?'),
+                                     _('{} already holds pages named {}-….{}, they will be overwritten.').format(
+                                         folder.get_basename(), name, output_format))
+        dialog.add_response('cancel', _('Cancel'))
+        dialog.add_response('replace', _('Replace'))
+        dialog.set_response_appearance('replace', Adw.ResponseAppearance.DESTRUCTIVE)
+        dialog.set_default_response('cancel')
+        dialog.set_close_response('cancel')
+        dialog.connect('response', self.on_replace_response, file, output_format)
+        dialog.present(self.parent)
+
+    def on_replace_response(self, dialog, response, file, output_format):
+        if response == 'replace':
+            self.create_pdf(file, output_format)
+
+    def create_pdf(self, file, output_format='pdf'):
+        if self.cancellable is not None:
+            return
+
+        # Everything the worker needs is copied here, so the grid can keep
+        # being edited while the pdf is rendered
+        rows = list(self.parent.document.iter_rows())
+
+        self.cancellable = Gio.Cancellable()
+        self.start_time = time.monotonic()
+        self.parent.export_progress_bar.set_fraction(0)
+        self.parent.export_revealer.set_reveal_child(True)
+
+        thread = threading.Thread(target=self.render_pdf,
+                                  args=(file,
+                                        output_format,
+                                        rows,
+                                        self.parent.document.column_quantity,
+                                        self.parent.document.page_width,
+                                        self.parent.document.page_height,
+                                        self.parent.document.font_size,
+                                        self.cancellable),
+                                  daemon=True)
+        thread.start()
+
+    def render_pdf(self, file, output_format, rows, column_quantity, page_width, page_height, font_size, cancellable):
+        # Runs in a worker thread, the results go back to the main loop with GLib.idle_add
+
+        try:
+            # cairo and Pango are only loaded by the first export, not at startup
+            import cairo
+            from . import render
+
+            if output_format == 'pdf':
+                # Cairo writes every finished page straight into the file, so the
+                # whole document is never held in memory at once
+                output_stream = file.replace(None, False, Gio.FileCreateFlags.NONE, cancellable)
+
+                try:
+                    surface = cairo.PDFSurface(OutputStreamWriter(output_stream), page_width, page_height)
+
+                    try:
+                        cache_counters = render.draw_pages(surface, rows, len(rows), column_quantity, page_width,
+                                                           page_height, font_size, cancellable, self.report_progress)
+                    finally:
+                        surface.finish()
+                except Exception:
+                    # Closing with a cancelled cancellable keeps the old file
+                    # untouched, whatever stopped the export
+                    cancellable.cancel()
+
+                    try:
+                        output_stream.close(cancellable)
+                    except GLib.Error:
+                        pass
+
+                    raise
+
+                output_stream.close(cancellable)
+            else:
+                cache_counters = render.render_pages(file.get_path(), output_format, rows, column_quantity,
+                                                     page_width, page_height, font_size,
+                                                     cancellable=cancellable, progress=self.report_progress)
+        except Exception as error:
+            # Any failure must reach save_file_complete, or no other export
+            # could be started
+            GLib.idle_add(self.save_file_complete, file, error, None)
+        else:
+            GLib.idle_add(self.save_file_complete, file, None, cache_counters)
+
+    def report_progress(self, fraction):
+        GLib.idle_add(self.parent.export_progress_bar.set_fraction, fraction)
+
+    def cancel(self, *args):
+        if self.cancellable is not None:
+            self.cancellable.cancel()
+
+    def save_file_complete(self, file, error, cache_counters):
+        elapsed = time.monotonic() - self.start_time
+        self.cancellable = None
+        self.parent.export_revealer.set_reveal_child(False)
+
+        if error is None:
+            message = _('Exported in {:.1f} s').format(elapsed)
+            hits, misses = cache_counters
+            # Debug output, the toast stays readable
+            print(f'Export of {file.get_uri()}: {elapsed:.3f} s, layout cache {hits} hits, {misses} misses',
+                  file=sys.stderr)
+
+            if profiling.profiler is not None:
+                profiling.profiler.add('pdf-export', profiling.profiler.now() - elapsed * 1e6,
+                                       layout_cache_hits=hits, layout_cache_misses=misses)
+        elif isinstance(error, GLib.Error) and error.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+            message = _('Export cancelled')
+        else:
+            message = _('Export failed: {}').format(error.message if isinstance(error, GLib.Error) else error)
+            print(f'Could not save {file.get_uri()}: {error}', file=sys.stderr)
+
+        self.parent.toast_overlay.add_toast(Adw.Toast.new(message))
 
-        pdf_text = self.convert_list_to_text()
+        return GLib.SOURCE_REMOVE
 
-        lines = pdf_text.split('\n\n')
+class DocumentPrint():
+    # Prints with the drawing code of the export. The page breaks are found
+    # once, from the row heights, and every draw-page only draws its page,
+    # so printing a few pages of a long document only lays out those.
 
-        for line in lines:
-            columns = line.split('|')
+    def __init__(self, parent):
+        self.parent = parent
+        self.layout_cache = None
+        self.rows = None
+        self.pages = None
+
+        self.operation = Gtk.PrintOperation()
+        self.operation.set_job_name(parent.get_title() or 'SignWriter')
+        self.operation.connect('begin-print', self.on_begin_print)
+        self.operation.connect('draw-page', self.on_draw_page)
+        self.operation.connect('end-print', self.on_end_print)
+
+    def run(self):
+        try:
+            self.operation.run(Gtk.PrintOperationAction.PRINT_DIALOG, self.parent)
+        except GLib.Error as error:
+            self.parent.show_error(_('Printing failed: {}').format(error.message))
+
+    def on_begin_print(self, operation, print_context):
+        from . import render
+
+        document = self.parent.document
+        self.render = render
+        # Printing runs on the main thread, while an export may be drawing
+        # with the shared cache in its own thread
+        self.layout_cache = render.LayoutCache()
+        self.rows = list(document.iter_rows())
+
+        # Only the row heights are needed for the page breaks, the cells
+        # are shaped and drawn by draw-page for the pages printed
+        preview = self.parent.preview
+
+        if preview is not None and len(preview.row_heights) == document.row_quantity:
+            row_heights = preview.row_heights
+        else:
+            row_heights = render.measure_rows(self.rows, document.font_size)
 
-            for i, column_text in enumerate(columns):
-                layout.set_text(column_text, -1)
-                column_x = x + i * column_width + (column_width - layout.get_pixel_size()[0]) / 2
-                context.move_to(column_x, y)
-                PangoCairo.show_layout(context, layout)
+        self.pages = render.break_pages(row_heights, document.page_height)
 
-                if i < len(columns) - 1:
-                    context.move_to(x + (i + 1) * column_width, y)
-                    context.line_to(x + (i + 1) * column_width, page_height - y)
-                    context.stroke()
+        operation.set_n_pages(max(len(self.pages), 1))
 
-            y += layout.get_pixel_size()[1] + 70
+    def on_draw_page(self, operation, print_context, page_number):
+        if page_number >= len(self.pages):
+            return
 
-        surface.finish()
-        pdf_data = GLib.Bytes.new(output_stream.getvalue())
+        document = self.parent.document
+        first, end = self.pages[page_number]
 
-        file.replace_contents_bytes_async(
-            pdf_data,
-            None,
-            False,
-            Gio.FileCreateFlags.NONE,
-            None,
-            self.save_file_complete
-        )
+        # The document page is scaled to fit the printable area
+        context = print_context.get_cairo_context()
+        scale = min(print_context.get_width() / document.page_width,
+                    print_context.get_height() / document.page_height)
+        context.scale(scale, scale)
 
-    def save_file_complete(self, file, result):
-        pass
+        self.render.draw_page(context,
+                              self.rows[first:end],
+                              document.column_quantity,
+                              document.page_width,
+                              document.page_height,
+                              document.font_size,
+                              self.layout_cache)
 
-    def convert_list_to_text(self):
-        result_text = ''
+    def on_end_print(self, operation, print_context):
+        self.layout_cache = None
+        self.rows = None
+        self.pages = None
 
-        for i in range(len(self.parent.text_list)):
-            if (i + 1) % self.parent.grid_column_quantity == 0:
-                result_text += self.parent.text_list[i]
-                result_text += '\n\n'
-            else:
-                result_text += self.parent.text_list[i] + '|'
+class DocumentStorage():
+    # Open and save documents, and save the edits in the background once a
+    # file was chosen
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.file = None
+        self.autosave_source = None
+        # Whether the document was edited while no file keeps it
+        self.unsaved = False
+
+        self.parent.document.connect('cell-changed', self.schedule_autosave)
+        self.parent.document.connect('resized', self.schedule_autosave)
+        self.parent.document.connect('settings-changed', self.schedule_autosave)
+
+    def open_dialog(self, *args):
+        if self.unsaved:
+            dialog = Adw.AlertDialog.new(_('Discard the current document?'),
+                                         _('It was never saved, opening another document loses it.'))
+            dialog.add_response('cancel', _('Cancel'))
+            dialog.add_response('discard', _('Discard'))
+            dialog.set_response_appearance('discard', Adw.ResponseAppearance.DESTRUCTIVE)
+            dialog.set_default_response('cancel')
+            dialog.set_close_response('cancel')
+            dialog.connect('response', self.on_discard_response)
+            dialog.present(self.parent)
+            return
+
+        self.choose_document()
+
+    def on_discard_response(self, dialog, response):
+        if response == 'discard':
+            self.choose_document()
+
+    def choose_document(self):
+        file_dialog = Gtk.FileDialog()
+        file_dialog.set_title(_("Open document"))
+        file_dialog.set_modal(True)
+        file_dialog.open(self.parent, None, self.on_open_dialog_response)
+
+    def on_open_dialog_response(self, dialog, result):
+        try:
+            file = dialog.open_finish(result)
+        except GLib.Error:
+            return
+
+        path = file.get_path()
+
+        if path is None:
+            self.parent.show_error(_('Only documents on this computer can be opened'))
+            return
+
+        try:
+            data, journal_entries = docfile.read(path)
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            self.parent.show_error(_('Could not open the document: {}').format(error))
+            return
+
+        self.close_file()
+        self.parent.document.load(data)
+        self.file = docfile.DocumentFile(path, self.parent.document, journal_entries)
+        self.unsaved = False
+
+    def save_dialog(self, *args):
+        if self.file is not None:
+            self.save()
+            return
+
+        file_dialog = Gtk.FileDialog()
+        file_dialog.set_title(_("Save document"))
+        file_dialog.set_initial_name('document.json')
+        file_dialog.set_modal(True)
+        file_dialog.save(self.parent, None, self.on_save_dialog_response)
+
+    def on_save_dialog_response(self, dialog, result):
+        try:
+            file = dialog.save_finish(result)
+        except GLib.Error:
+            return
+
+        if file.get_path() is None:
+            self.parent.show_error(_('Documents can only be saved on this computer'))
+            return
+
+        self.close_file()
+        self.file = docfile.DocumentFile(file.get_path(), self.parent.document)
+        self.unsaved = False
+        self.save()
+
+    def close_file(self):
+        if self.autosave_source is not None:
+            GLib.source_remove(self.autosave_source)
+            self.autosave_source = None
+
+        # The edits not written yet still belong to the file being left
+        self.save()
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def schedule_autosave(self, *args):
+        if self.file is None:
+            self.unsaved = True
+        elif self.autosave_source is None:
+            self.autosave_source = GLib.timeout_add_seconds(2, self.autosave)
+
+    def autosave(self):
+        self.autosave_source = None
+        self.save()
+        return GLib.SOURCE_REMOVE
+
+    def save(self, *args):
+        if self.file is None:
+            return False
+
+        try:
+            self.file.flush()
+        except OSError as error:
+            self.parent.show_error(_('Could not save the document: {}').format(error))
+
+        # Also used for close-request, the window must still close
+        return False
+
+class SignImport():
+    # Fills the grid with the signs of a FSW or SWU text file. The file is
+    # read a little at a time in idle callbacks, so the window keeps
+    # responding while a large corpus comes in.
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.file = None
+
+    def dialog(self, *args):
+        file_dialog = Gtk.FileDialog()
+        file_dialog.set_title(_("Import SignWriting text"))
+        file_dialog.set_modal(True)
+        file_dialog.open(self.parent, None, self.on_dialog_response)
+
+    def on_dialog_response(self, dialog, result):
+        try:
+            file = dialog.open_finish(result)
+        except GLib.Error:
+            return
+
+        if self.file is not None:
+            return
+
+        path = file.get_path()
+
+        if path is None:
+            self.parent.show_error(_('Only files on this computer can be imported'))
+            return
+
+        # The signs go from the selected cell on, or below the last row in
+        # use. Cells that already hold symbols are only written over once
+        # the user agreed.
+        document = self.parent.document
+        cells = [(row, column) for row in range(document.row_quantity) for column in range(document.column_quantity)]
+        used = [position for position, cell in enumerate(cells) if not document.is_empty(*cell)]
+        below = (used[-1] // document.column_quantity + 1) * document.column_quantity if used else 0
+
+        if self.parent.current_box is None:
+            self.start(path, below)
+            return
+
+        row, column = self.parent.current_box
+        position = row * document.column_quantity + column
+
+        if not used or used[-1] < position:
+            self.start(path, position)
+            return
+
+        dialog = Adw.AlertDialog.new(_('Write over the existing signs?'),
+                                     _('The imported signs go from the selected cell on, the cells after it '
+                                       'that hold symbols will be replaced.'))
+        dialog.add_response('cancel', _('Cancel'))
+        dialog.add_response('below', _('Add Below'))
+        dialog.add_response('replace', _('Replace'))
+        dialog.set_response_appearance('replace', Adw.ResponseAppearance.DESTRUCTIVE)
+        dialog.set_default_response('below')
+        dialog.set_close_response('cancel')
+        dialog.connect('response', self.on_replace_response, path, position, below)
+        dialog.present(self.parent)
+
+    def on_replace_response(self, dialog, response, path, position, below):
+        if response == 'replace':
+            self.start(path, position)
+        elif response == 'below':
+            self.start(path, below)
+
+    def start(self, path, position):
+        if self.file is not None:
+            return
+
+        try:
+            self.file = open(path, encoding='utf-8')
+        except OSError as error:
+            self.parent.show_error(_('Could not import the signs: {}').format(error))
+            return
+
+        self.signs = fsw.read_signs(self.file)
+        self.sign_count = 0
+        self.start_time = time.monotonic()
+        self.position = position
+
+        self.parent.set_editable(False)
+        self.parent.history.begin_group()
+        GLib.idle_add(self.import_batch)
+
+    def import_batch(self):
+        document = self.parent.document
+        batch = list()
+        deadline = time.monotonic() + BATCH_TIME
+
+        try:
+            for sign in self.signs:
+                batch.append(sign)
+
+                if len(batch) % 64 == 0 and time.monotonic() > deadline:
+                    break
+        except (fsw.ParseError, ValueError, OSError) as error:
+            # Nothing is kept from a file that cannot be read to the end
+            self.finish()
+            self.parent.history.cancel_group()
+            self.parent.set_editable(True)
+            self.parent.show_error(_('Could not import the signs: {}').format(error))
+            return GLib.SOURCE_REMOVE
+
+        if batch:
+            # One resize per batch, the grid view only gets the new rows once
+            end = self.position + len(batch)
+            row_quantity = -(-end // document.column_quantity)
+
+            if row_quantity > document.row_quantity:
+                document.resize(row_quantity, document.column_quantity)
+
+            for sign in batch:
+                document.set_symbols(*divmod(self.position, document.column_quantity), sign)
+                self.position += 1
+
+            self.sign_count += len(batch)
+            return GLib.SOURCE_CONTINUE
+
+        self.finish()
+        self.parent.history.end_group()
+        self.parent.set_editable(True)
+
+        elapsed = max(time.monotonic() - self.start_time, 1e-6)
+        message = _('{} signs imported in {:.1f} s').format(self.sign_count, elapsed)
+        self.parent.toast_overlay.add_toast(Adw.Toast.new(message))
+
+        return GLib.SOURCE_REMOVE
+
+    def finish(self):
+        self.file.close()
+        self.file = None
+        self.signs = None
+
+def pick_attribute(widget, x, y, name):
+    # The attribute name of the widget at (x, y) of widget, or of its
+    # closest parent that has it. Boxes of the grid and the palette carry
+    # their cell or their symbol this way, so one click controller on the
+    # container is enough.
+
+    picked = widget.pick(x, y, Gtk.PickFlags.DEFAULT)
+
+    while picked is not None and picked != widget:
+        value = getattr(picked, name, None)
+
+        if value is not None:
+            return value
+
+        picked = picked.get_parent()
+
+    return None
+
+class PreviewPane():
+    # Pages drawn by the export code into image surfaces kept between
+    # redraws. An edit only throws away the surfaces of the pages it
+    # changes, and only the pages on screen are drawn again, in idle time.
+    # Row heights are measured in idle time too, a few rows per call, and
+    # the pages are added as the rows they hold are known.
+
+    # Width of a page in the pane, in pixels
+    PAGE_WIDTH = 280
+
+    def __init__(self, parent):
+        from . import render
+
+        self.render = render
+        self.document = parent.document
+        # The pane draws on the main thread, the shared cache is used by
+        # the export threads
+        self.layout_cache = render.LayoutCache()
+        # Heights of the rows measured so far, from the first one
+        self.row_heights = list()
+        self.pages = list()
+        # page number -> surface, missing for the pages that must be redrawn
+        self.surfaces = dict()
+        # page number -> drawing area of the pages bound in the list view
+        self.areas = dict()
+        self.render_source = None
+        self.measure_source = None
+
+        self.page_list = Gio.ListStore.new(PreviewPage)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect('setup', self.on_page_setup)
+        factory.connect('bind', self.on_page_bind)
+        factory.connect('unbind', self.on_page_unbind)
+
+        list_view = Gtk.ListView()
+        list_view.set_model(Gtk.NoSelection.new(self.page_list))
+        list_view.set_factory(factory)
+        list_view.set_can_focus(False)
 
-        return result_text
+        self.scrolled_window = Gtk.ScrolledWindow()
+        self.scrolled_window.set_child(list_view)
+        self.scrolled_window.set_size_request(self.PAGE_WIDTH + 30, -1)
+        self.scrolled_window.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
 
+        self.document.connect('cell-changed', self.on_cell_changed)
+        self.document.connect('resized', self.on_document_resized)
+        self.document.connect('reset', self.relayout)
+        self.document.connect('settings-changed', self.relayout)
+        self.relayout()
+
+    def get_font_description(self):
+        return self.render.get_font_description(self.document.font_size)
+
+    def get_row_texts(self, row):
+        return [self.document.get_text(row, column) for column in range(self.document.column_quantity)]
+
+    def relayout(self, *args):
+        # Every page changes, for a new document or a new font or page size
+
+        self.row_heights = list()
+        self.surfaces.clear()
+
+        # The first pages right away, the others in idle time
+        self.measure_batch()
+        self.schedule_measure()
+
+    def measure_batch(self):
+        font_desc = self.get_font_description()
+        deadline = time.monotonic() + BATCH_TIME
+
+        while len(self.row_heights) < self.document.row_quantity and time.monotonic() < deadline:
+            self.row_heights.append(self.render.row_height(self.get_row_texts(len(self.row_heights)),
+                                                           font_desc, self.layout_cache))
+
+        self.repaginate()
+
+    def schedule_measure(self):
+        if self.measure_source is None and len(self.row_heights) < self.document.row_quantity:
+            self.measure_source = GLib.idle_add(self.measure_rows)
+
+    def measure_rows(self):
+        self.measure_batch()
+
+        if len(self.row_heights) < self.document.row_quantity:
+            return GLib.SOURCE_CONTINUE
+
+        self.measure_source = None
+        return GLib.SOURCE_REMOVE
+
+    def on_cell_changed(self, row, column):
+        if row >= len(self.row_heights):
+            # Not measured yet, the idle measure will read the new text
+            return
+
+        height = self.render.row_height(self.get_row_texts(row), self.get_font_description(), self.layout_cache)
+
+        if height == self.row_heights[row]:
+            # Only the page of this row is drawn again
+            self.invalidate(bisect.bisect_right(self.pages, (row, math.inf)) - 1)
+            return
+
+        self.row_heights[row] = height
+        self.repaginate(changed_row=row)
+
+    def on_document_resized(self, old_row_quantity, old_column_quantity):
+        if self.document.column_quantity != old_column_quantity:
+            self.relayout()
+            return
+
+        # New rows are measured in idle time
+        del self.row_heights[self.document.row_quantity:]
+        self.repaginate()
+        self.schedule_measure()
+
+    def repaginate(self, changed_row=None):
+        # Pages keep their surface when they still show the same rows
+
+        old_pages = self.pages
+        pages = self.render.break_pages(self.row_heights, self.document.page_height)
+
+        for number, (first, end) in enumerate(pages):
+            if (number >= len(old_pages) or old_pages[number] != (first, end)
+                    or (changed_row is not None and first <= changed_row < end)):
+                self.surfaces.pop(number, None)
+
+        self.update_pages(pages)
+
+    def update_pages(self, pages):
+        for number in range(len(pages), len(self.pages)):
+            self.surfaces.pop(number, None)
+
+        old_page_quantity = len(self.pages)
+        self.pages = pages
+
+        if len(pages) != old_page_quantity:
+            self.page_list.splice(min(len(pages), old_page_quantity),
+                                  max(0, old_page_quantity - len(pages)),
+                                  [PreviewPage(number) for number in range(old_page_quantity, len(pages))])
+
+        for number, area in self.areas.items():
+            if number not in self.surfaces:
+                area.set_content_height(self.get_page_height())
+                area.queue_draw()
+
+    def invalidate(self, number):
+        self.surfaces.pop(number, None)
+        area = self.areas.get(number)
+
+        if area is not None:
+            area.queue_draw()
+
+    def get_page_height(self):
+        return round(self.document.page_height * self.PAGE_WIDTH / self.document.page_width)
+
+    def on_page_setup(self, factory, list_item):
+        area = Gtk.DrawingArea()
+        area.set_content_width(self.PAGE_WIDTH)
+        area.set_draw_func(self.draw_page)
+        area.set_margin_top(10)
+        area.set_margin_bottom(10)
+        list_item.set_child(area)
+
+    def on_page_bind(self, factory, list_item):
+        area = list_item.get_child()
+        area.number = list_item.get_item().number
+        area.set_content_height(self.get_page_height())
+        self.areas[area.number] = area
+        area.queue_draw()
+
+    def on_page_unbind(self, factory, list_item):
+        area = list_item.get_child()
+
+        if self.areas.get(area.number) is area:
+            del self.areas[area.number]
+
+    def draw_page(self, area, context, width, height):
+        surface = self.surfaces.get(area.number)
+
+        if surface is None:
+            # A blank page until the idle callback has drawn it
+            context.set_source_rgb(1, 1, 1)
+            context.paint()
+
+            if self.render_source is None:
+                self.render_source = GLib.idle_add(self.render_dirty_page)
+            return
+
+        context.set_source_surface(surface, 0, 0)
+        context.paint()
+
+    def render_dirty_page(self):
+        # Draws one page per call, so typing is never held up for long
+
+        for number, area in self.areas.items():
+            if number not in self.surfaces and number < len(self.pages) and area.get_mapped():
+                break
+        else:
+            self.render_source = None
+            return GLib.SOURCE_REMOVE
+
+        cairo = self.render.cairo
+        scale = self.PAGE_WIDTH / self.document.page_width
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.PAGE_WIDTH, self.get_page_height())
+        context = cairo.Context(surface)
+        context.set_source_rgb(1, 1, 1)
+        context.paint()
+        context.set_source_rgb(0, 0, 0)
+        context.scale(scale, scale)
+
+        first, end = self.pages[number]
+        self.render.draw_page(context,
+                              [self.get_row_texts(row) for row in range(first, end)],
+                              self.document.column_quantity,
+                              self.document.page_width,
+                              self.document.page_height,
+                              self.document.font_size,
+                              self.layout_cache)
+
+        self.surfaces[number] = surface
+        area.queue_draw()
+
+        return GLib.SOURCE_CONTINUE
+
+class PreviewPage(GObject.Object):
+    __gtype_name__ = 'SignwriterPreviewPage'
+
+    def __init__(self, number):
+        super().__init__()
+        self.number = number
+
+class PaletteItem(GObject.Object):
+    __gtype_name__ = 'SignwriterPaletteItem'
+
+    def __init__(self, number, entry):
+        super().__init__()
+        self.number = number
+        self.entry = entry
+
+class Cell(GObject.Object):
+    __gtype_name__ = 'SignwriterCell'
+
+    def __init__(self, row, column):
+        super().__init__()
+        self.row = row
+        self.column = column
+
+class CellList(GObject.Object, Gio.ListModel):
+    # List model of the document cells for the grid view, the text
+    # itself is always read from the document
+
+    def __init__(self, document):
+        super().__init__()
+        self.document = document
+        self.n_items = 0
+
+    def do_get_item_type(self):
+        return Cell.__gtype__
+
+    def do_get_n_items(self):
+        return self.n_items
+
+    def do_get_item(self, position):
+        if position >= self.n_items:
+            return None
+
+        return Cell(*divmod(position, self.document.column_quantity))
+
+    def reset(self):
+        removed = self.n_items
+        self.n_items = self.document.row_quantity * self.document.column_quantity
+        self.items_changed(0, removed, self.n_items)
+
+    def resize(self, old_row_quantity, old_column_quantity):
+        if old_column_quantity != self.document.column_quantity:
+            # Every position moves when the column count changes, the grid
+            # view still only rebinds the cells on screen
+            self.reset()
+            return
+
+        old_n_items = self.n_items
+        self.n_items = self.document.row_quantity * self.document.column_quantity
+
+        if self.n_items > old_n_items:
+            self.items_changed(old_n_items, 0, self.n_items - old_n_items)
+        elif self.n_items < old_n_items:
+            self.items_changed(self.n_items, old_n_items - self.n_items, 0)
+
+def instrument_hot_paths():
+    # Called by --profile before the first window is created, so the
+    # handlers connected in __init__ are already the recording ones
+    from . import render
+
+    profiling.instrument(SignwriterWindow, 'on_document_reset', 'grid-reset')
+    profiling.instrument(SignwriterWindow, 'on_document_resized', 'grid-resize')
+    profiling.instrument(SymbolScreen, 'create_page', 'palette-page')
+    profiling.instrument(SymbolScreen, 'create_search_page', 'palette-search-page')
+    profiling.instrument(SymbolScreen, 'search', 'palette-search')
+    profiling.instrument(SaveFile, 'create_pdf', 'pdf-export-snapshot')
+    profiling.instrument(SaveFile, 'render_pdf', 'pdf-export-render')
+    profiling.instrument(render, 'draw_pages', 'pdf-draw-pages')
+    profiling.instrument(docfile.DocumentFile, 'flush', 'autosave')
+
+class OutputStreamWriter():
+    # File-like object that lets cairo write directly into a Gio.OutputStream
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        self.stream.write_all(data, None)
+        return len(data)